@@ -29,17 +29,18 @@ def main():
 
     # print(comp_file_lines)
 
-    computers = '"' + '";"'.join(comp_file_lines) + '"'
-
     # by default, this will only return computers that have not reported in >90 days:
-    session_relevance = f"unique values of ids of bes computers whose(now - last report time of it > 90 * day AND exists elements of intersections of (it; sets of ({computers})) of sets of (name of it; id of it as string))"
+    session_relevance = "unique values of (id of it as string) of bes computers whose(now - last report time of it > 90 * day AND exists elements of intersections of (it; sets of ({values})) of sets of (name of it; id of it as string))"
 
     # get session relevance result of computer ids from list of computer ids or computer names:
-    results = bes_conn.session_relevance_array(session_relevance)
+    # large lists are split into chunks that are queried in parallel
+    results = bes_conn.session_relevance_set_membership(
+        session_relevance, comp_file_lines
+    )
 
     # print(results)
 
-    if "Nothing returned, but no error." in results[0]:
+    if not results:
         print("WARNING: No computers found to delete!")
         return None
 
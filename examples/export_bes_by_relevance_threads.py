@@ -13,7 +13,15 @@ import besapi
 def main():
     """Execution starts here."""
     print("main()")
-    bes_conn = besapi.besapi.get_bes_conn_using_config_file()
+    max_workers = 3
+
+    # one connection shared by all of the threads:
+    bes_conn = besapi.besapi.get_bes_conn_using_config_file(
+        thread_safe=True,
+        pool_maxsize=max_workers,
+        # threads that GET the same resource at the same time share one request:
+        single_flight=True,
+    )
     bes_conn.login()
 
     print(bes_conn.last_connected)
@@ -26,7 +34,7 @@ def main():
 
     result = bes_conn.session_relevance_array(session_relevance)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [
             executor.submit(bes_conn.export_item_by_resource, item, "./tmp/")
             for item in result
@@ -26,6 +26,9 @@ Other candidates for eval mime field addition due to slow relevance:
 
 Use this session relevance to find fixlets missing the mime field:
 - https://bigfix.me/relevance/details/3023816
+
+To find and score these slow patterns in exported .bes files or folders before
+they are imported, see `besapi.relevance_lint`
 """
 
 import logging
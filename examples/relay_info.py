@@ -121,31 +121,24 @@ def main():
     # defaults to 900 days:
     last_report_days_filter = args.days
 
-    # get relay info:
-    session_relevance = f"""(multiplicity of it, it) of unique values of (it as string) of (relay selection method of it | "NoRelayMethod" , relay server of it | "NoRelayServer") of bes computers whose(now - last report time of it < {last_report_days_filter} * day)"""
-    results = bes_conn.session_relevance_string(session_relevance)
-
-    logging.info("Relay Info:\n%s", results)
-
-    session_relevance = f"""(multiplicity of it, it) of unique values of (it as string) of (relay selection method of it | "NoRelayMethod" , relay server of it | "NoRelayServer", relay hostname of it | "NoRelayHostname", id of it | 0) of bes computers whose(now - last report time of it < {last_report_days_filter} * day AND relay server flag of it)"""
-    results = bes_conn.session_relevance_string(session_relevance)
-
-    logging.info("Info on Relays:\n%s", results)
-
-    session_relevance = f"""unique values of values of client settings whose(name of it = "_BESClient_Relay_NameOverride") of bes computers whose(now - last report time of it < {last_report_days_filter} * day)"""
-    results = bes_conn.session_relevance_string(session_relevance)
-
-    logging.info("Relay name override values:\n%s", results)
-
-    session_relevance = f"""(multiplicity of it, it) of unique values of values of client settings whose(name of it = "_BESRelay_Register_Affiliation_AdvertisementList") of bes computers whose(now - last report time of it < {last_report_days_filter} * day)"""
-    results = bes_conn.session_relevance_string(session_relevance)
-
-    logging.info("Relay_Register_Affiliation values:\n%s", results)
-
-    session_relevance = f"""(multiplicity of it, it) of unique values of values of client settings whose(name of it = "_BESClient_Register_Affiliation_SeekList") of bes computers whose(now - last report time of it < {last_report_days_filter} * day)"""
-    results = bes_conn.session_relevance_string(session_relevance)
-
-    logging.info("Client_Register_Affiliation_Seek values:\n%s", results)
+    computers_rel = f"bes computers whose(now - last report time of it < {last_report_days_filter} * day)"
+
+    # get all relay info in a single request:
+    relay_info_relevance = {
+        "Relay Info": f"""(multiplicity of it, it) of unique values of (it as string) of (relay selection method of it | "NoRelayMethod" , relay server of it | "NoRelayServer") of {computers_rel}""",
+        "Info on Relays": f"""(multiplicity of it, it) of unique values of (it as string) of (relay selection method of it | "NoRelayMethod" , relay server of it | "NoRelayServer", relay hostname of it | "NoRelayHostname", id of it | 0) of {computers_rel} whose(relay server flag of it)""",
+        "Relay name override values": f"""unique values of values of client settings whose(name of it = "_BESClient_Relay_NameOverride") of {computers_rel}""",
+        "Relay_Register_Affiliation values": f"""(multiplicity of it, it) of unique values of values of client settings whose(name of it = "_BESRelay_Register_Affiliation_AdvertisementList") of {computers_rel}""",
+        "Client_Register_Affiliation_Seek values": f"""(multiplicity of it, it) of unique values of values of client settings whose(name of it = "_BESClient_Register_Affiliation_SeekList") of {computers_rel}""",
+    }
+
+    batch_results = bes_conn.session_relevance_batch(relay_info_relevance.values())
+
+    for description, result in zip(relay_info_relevance.keys(), batch_results):
+        if result["error"]:
+            logging.error("%s:\n%s", description, result["error"])
+        else:
+            logging.info("%s:\n%s", description, "\n".join(result["result"]))
 
     # this should require MO:
     results = bes_conn.get("admin/masthead/parameters")
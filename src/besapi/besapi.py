@@ -10,11 +10,16 @@ Maintained by James Stewart since 2021
 Library for communicating with the BES (BigFix) REST API.
 """
 
+import codecs
+import collections
+import concurrent.futures
 import configparser
+import contextlib
 import datetime
 import getpass
 import hashlib
 import importlib.resources
+import itertools
 import json
 import logging
 import os
@@ -22,12 +27,21 @@ import random
 import site
 import string
 import sys
+import threading
+import time
 import urllib.parse
 
 import lxml.etree
 import lxml.objectify
 import requests
 import urllib3.poolmanager
+import urllib3.util
+
+if __package__:
+    from . import relevance_columns
+else:
+    # running besapi.py directly as a script:
+    import relevance_columns  # type: ignore[no-redef]
 
 __version__ = "4.1.5"
 
@@ -65,34 +79,114 @@ def sanitize_txt(*args):
     return tuple(sani_args)
 
 
-def elem2dict(node):
+def elem2dict(node, attributes=False, force_list=()):
     """
     Convert an lxml.etree node tree into a dict.
 
+    Elements with text become strings, other elements become dicts of their
+    children, and tags that repeat become lists.
+    If attributes is True, attributes are kept as `@name` keys, and the text of
+    an element that has attributes is kept as `#text`.
+    Tags in force_list are always lists, even if they only appear once.
+
+    This walks the tree without recursion, so deep trees are not a problem.
+
     https://gist.github.com/jacobian/795571?permalink_comment_id=2981870#gistcomment-2981870
     """
+    force_list = frozenset(force_list)
     result = {}
+    if attributes:
+        elem2dict_attributes(node, result)
+
+    # stack of (element, dict to put its children in):
+    stack = [(node, result)]
+    while stack:
+        parent, parent_dict = stack.pop()
+        for element in parent.iterchildren(lxml.etree.Element):
+            # Remove namespace prefix
+            key = element.tag.split("}")[1] if "}" in element.tag else element.tag
+
+            # Process element as tree element if the inner XML contains non-whitespace content
+            if element.text and element.text.strip():
+                value = element.text
+                if attributes and element.attrib:
+                    value = elem2dict_attributes(element, {})
+                    value["#text"] = element.text
+            else:
+                value = {}
+                if attributes:
+                    elem2dict_attributes(element, value)
+                stack.append((element, value))
+
+            if key in parent_dict:
+                # values are only ever lists if the tag repeats
+                if type(parent_dict[key]) is list:
+                    parent_dict[key].append(value)
+                else:
+                    parent_dict[key] = [parent_dict[key], value]
+            elif key in force_list:
+                parent_dict[key] = [value]
+            else:
+                parent_dict[key] = value
+
+    return result
+
 
-    for element in node.iterchildren():
+def elem2dict_value(element, attributes=False, force_list=()):
+    """Convert a single element to the value elem2dict would give it."""
+    if element.text and element.text.strip():
+        if attributes and element.attrib:
+            value = elem2dict_attributes(element, {})
+            value["#text"] = element.text
+            return value
+        return element.text
+
+    return elem2dict(element, attributes, force_list)
+
+
+def elem2dict_attributes(element, result):
+    """Add the attributes of an element to a dict as `@name` keys."""
+    for name, value in element.attrib.items():
         # Remove namespace prefix
-        key = element.tag.split("}")[1] if "}" in element.tag else element.tag
+        name = name.split("}")[1] if "}" in name else name
+        result["@" + name] = value
 
-        # Process element as tree element if the inner XML contains non-whitespace content
-        if element.text and element.text.strip():
-            value = element.text
-        else:
-            value = elem2dict(element)
-        if key in result:
-            if type(result[key]) is list:
-                result[key].append(value)
-            else:
-                tempvalue = result[key].copy()
-                result[key] = [tempvalue, value]
-        else:
-            result[key] = value
     return result
 
 
+def json_dumps_nested(value, indent=None, level=0):
+    """Get json for a value that will be nested inside other json.
+
+    With indent, the output lines up as if the whole document had been
+    dumped with json.dumps(indent=indent). Without indent it is compact.
+    """
+    if indent is None:
+        return json.dumps(value, separators=(",", ":"))
+
+    return json.dumps(value, indent=indent).replace("\n", "\n" + " " * indent * level)
+
+
+def write_json_elements(elements, file, attributes=False, force_list=()):
+    """Write elements to a file like object as JSON Lines.
+
+    Each element becomes one line like `{"Computer": {...}}`, converted the
+    same way as elem2dict. This works with the elements yielded by
+    BESConnection.iter_get to convert a listing without holding it in memory.
+    Returns the number of lines written.
+    """
+    count = 0
+    for element in elements:
+        # Remove namespace prefix
+        key = element.tag.split("}")[1] if "}" in element.tag else element.tag
+        file.write(
+            json_dumps_nested({key: elem2dict_value(element, attributes, force_list)})
+        )
+        file.write("\n")
+        count += 1
+
+    return count
+
+
 # https://stackoverflow.com/questions/16159969/replace-all-text-between-2-strings-python
 def replace_text_between(
     original_text, first_delimiter, second_delimiter, replacement_text
@@ -145,6 +239,220 @@ def get_action_combined_relevance(relevances: list[str]):
     return relevance_combined
 
 
+def iter_json_array(chunks, key="result", metadata=None, max_tuple_items=1000):
+    """Incrementally parse a json object from text chunks and yield array items.
+
+    The items of the array member named key are yielded one at a time while
+    the chunks are still being read, so the whole document is never in memory.
+    Other top level members like `plural`, `type` and `evaltime_ms` are stored
+    in the metadata dict, if provided, as they are parsed.
+
+    Singular results are wrapped like get_json_result_list does: a member
+    that is not an array is yielded as the only item, and so is an array
+    when `plural` is false, like a singular tuple. BigFix sends `plural`
+    after `result`, so arrays of up to max_tuple_items values that are not
+    lists are held back until `plural` is known. Larger arrays, or arrays of
+    tuple rows, are streamed as they are read.
+    """
+    if metadata is None:
+        metadata = {}
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, position, exhausted
+        for chunk in chunks:
+            if chunk:
+                # drop what has already been parsed:
+                buffer = buffer[position:] + chunk
+                position = 0
+                return True
+        exhausted = True
+        return False
+
+    def peek():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                raise ValueError("Unexpected end of json")
+
+    def expect(chars):
+        nonlocal position
+        char = peek()
+        if char not in chars:
+            raise ValueError(
+                f"Expected one of `{chars}` but found `{char}` in json: `{buffer[position:position + 40]}`"
+            )
+        position += 1
+        return char
+
+    def decode_value():
+        nonlocal position
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # a number at the end of the buffer might continue in the next chunk:
+                if end < len(buffer) or exhausted:
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            read_more()
+
+    expect("{")
+    if peek() == "}":
+        return
+
+    held_items = None
+
+    while True:
+        name = decode_value()
+        expect(":")
+        if name == key and (peek() != "[" or metadata.get("plural") is False):
+            yield decode_value()
+        elif name == key:
+            expect("[")
+            # items that might be a singular tuple, until plural is known:
+            held_items = []
+            if peek() == "]":
+                position += 1
+            else:
+                while True:
+                    value = decode_value()
+                    if held_items is None:
+                        yield value
+                    else:
+                        held_items.append(value)
+                        if isinstance(value, list) or len(held_items) > max_tuple_items:
+                            yield from held_items
+                            held_items = None
+                    if expect(",]") == "]":
+                        break
+        else:
+            metadata[name] = decode_value()
+
+        if expect(",}") == "}":
+            break
+
+    if held_items and metadata.get("plural") is False:
+        yield held_items
+    elif held_items:
+        yield from held_items
+
+
+def get_json_result_list(json_result):
+    """Get the result of a session relevance json response as a list.
+
+    The result of a singular relevance expression is not in a list, and a
+    singular tuple is a list of its items, so this uses `plural` to tell.
+    """
+    result = json_result["result"]
+    if json_result.get("plural") is False or not isinstance(result, list):
+        return [result]
+    return result
+
+
+def get_batch_relevance(relevances):
+    """Combine session relevance expressions into one relevance query.
+
+    Each answer is returned as a tuple of the index of the expression it came
+    from and the answer as a string, so the results can be split up again.
+    """
+    return " ; ".join(
+        f"({index}, (it as string) of ( {relevance} ))"
+        for index, relevance in enumerate(relevances)
+    )
+
+
+def get_modulo_shard_filters(shards, expression="id of it"):
+    """Get relevance filters that split items into shards by modulo of an id.
+
+    For use with BESConnection.session_relevance_sharded
+    """
+    return [f"({expression}) mod {shards} = {shard}" for shard in range(shards)]
+
+
+def get_range_shard_filters(start, stop, step, expression="id of it"):
+    """Get relevance filters that split items into shards by ranges of an id.
+
+    Items outside of start to stop are not in any shard.
+    For use with BESConnection.session_relevance_sharded
+    """
+    return [
+        f"({expression}) >= {low} AND ({expression}) < {min(low + step, stop)}"
+        for low in range(start, stop, step)
+    ]
+
+
+def get_relevance_string(value):
+    """Get a relevance string literal for a value, escaping `%` and quotes."""
+    return '"' + str(value).replace("%", "%25").replace('"', "%22") + '"'
+
+
+def get_relevance_set_chunks(values, chunk_size=500, max_length=20000):
+    """Split values into chunks of relevance string literals for set queries.
+
+    Each chunk is like `"a";"b";"c"` and can be used in `set of (...)`.
+    Duplicate values are dropped, and each chunk has no more than chunk_size
+    values or max_length characters, so no single query gets too large.
+    """
+    seen = set()
+    chunk = []
+    length = 0
+    for value in values:
+        literal = get_relevance_string(value)
+        if literal in seen:
+            continue
+        seen.add(literal)
+
+        if chunk and (
+            len(chunk) >= chunk_size or length + len(literal) + 1 > max_length
+        ):
+            yield ";".join(chunk)
+            chunk = []
+            length = 0
+        chunk.append(literal)
+        length += len(literal) + 1
+
+    if chunk:
+        yield ";".join(chunk)
+
+
+def get_relevance_answers(rel_result):
+    """Get the answers of a session relevance xml RESTResult as a list of strings."""
+    result = []
+    try:
+        for item in rel_result.besobj.Query.Result.Answer:
+            result.append(item.text)
+    except AttributeError as err:
+        # print(err)
+        if "no such child: Answer" in str(err):
+            try:
+                result.append("ERROR: " + rel_result.besobj.Query.Error.text)
+            except AttributeError as err2:
+                if "no such child: Error" in str(err2):
+                    result.append("<Nothing> Nothing returned, but no error.")
+                    besapi_logger.info("Query did not return any results")
+                else:
+                    besapi_logger.error("%s\n%s", err2, rel_result.text)
+                    result.append("ERROR: " + rel_result.text)
+                    raise
+        else:
+            besapi_logger.error("%s\n%s", err, rel_result.text)
+            result.append("ERROR: " + rel_result.text)
+            raise
+    return result
+
+
 def get_target_xml(targets=None):
     """Get target xml based upon input.
 
@@ -208,30 +516,181 @@ def get_target_xml(targets=None):
     return "<CustomRelevance>False</CustomRelevance>"
 
 
-def validate_xsd(doc):
-    """Validate results using XML XSDs."""
-    try:
-        xmldoc = lxml.etree.fromstring(doc)
-    except BaseException:  # pylint: disable=broad-except
-        return False
+# XSD files shipped in besapi/schemas, in the order they are tried:
+BES_XSD_FILES = ("BES.xsd", "BESAPI.xsd", "BESActionSettings.xsd")
+
+# XSDs that can validate a document, by root tag of the document:
+# (BES.xsd also declares a global ActionSettings element)
+BES_XSD_ROOTS = {
+    "BES": ("BES.xsd",),
+    "BESAPI": ("BESAPI.xsd",),
+    "ActionSettings": ("BESActionSettings.xsd", "BES.xsd"),
+}
+
+
+class XMLSchemaRegistry:
+    """Process wide registry of compiled XML Schemas.
+
+    Each XSD is read from the package resources and compiled into an
+    lxml.etree.XMLSchema once, the first time it is needed. Compiled schemas
+    are read only and can be shared between threads.
+    """
+
+    def __init__(self, xsd_files=BES_XSD_FILES):
+        self.xsd_files = tuple(xsd_files)
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, xsd):
+        return xsd in self._schemas
+
+    def __repr__(self):
+        return f"Object: besapi.XMLSchemaRegistry( loaded={self.loaded()} )"
+
+    def get(self, xsd):
+        """Get the compiled schema for an XSD file name, compile if needed."""
+        schema = self._schemas.get(xsd)
+        if schema is not None:
+            return schema
+
+        if xsd not in self.xsd_files:
+            raise KeyError(f"Unknown XSD `{xsd}`, expected one of {self.xsd_files}")
+
+        with self._lock:
+            # another thread may have compiled it while waiting for the lock
+            schema = self._schemas.get(xsd)
+            if schema is None:
+                schema = self._compile(xsd)
+                self._schemas[xsd] = schema
 
-    for xsd in ["BES.xsd", "BESAPI.xsd", "BESActionSettings.xsd"]:
+        return schema
+
+    def _compile(self, xsd):
+        """Read and compile a single XSD from package resources."""
+        besapi_logger.debug("Compiling XML Schema `%s`", xsd)
         schema_path = importlib.resources.files(__package__) / f"schemas/{xsd}"
-        with schema_path.open("r") as xsd_file:
+        with schema_path.open("rb") as xsd_file:
             xmlschema_doc = lxml.etree.parse(xsd_file)
 
-        # one schema may throw an error while another will validate
         try:
-            xmlschema = lxml.etree.XMLSchema(xmlschema_doc)
+            return lxml.etree.XMLSchema(xmlschema_doc)
         except lxml.etree.XMLSchemaParseError as err:
             # this should only error if the XSD itself is malformed
             besapi_logger.error("ERROR with `%s`: %s", xsd, err)
             raise err
 
-        if xmlschema.validate(xmldoc):
-            return True
+    def candidates(self, root_tag):
+        """Get the XSDs to try for a document with the given root tag.
+
+        Unknown root tags get every XSD, in the default order.
+        """
+        # Remove namespace prefix
+        if "}" in root_tag:
+            root_tag = root_tag.split("}")[1]
+
+        return BES_XSD_ROOTS.get(root_tag, self.xsd_files)
+
+    def preload(self):
+        """Compile all known XSDs now instead of on first use."""
+        for xsd in self.xsd_files:
+            self.get(xsd)
 
-    return False
+        return self.loaded()
+
+    def loaded(self):
+        """Get the names of the XSDs compiled so far."""
+        return [xsd for xsd in self.xsd_files if xsd in self._schemas]
+
+    def clear(self):
+        """Drop all compiled schemas, they will be compiled again on next use."""
+        with self._lock:
+            self._schemas.clear()
+
+
+schema_registry = XMLSchemaRegistry()
+
+# When RESTResult checks a response against the XSDs:
+# - eager: as soon as the response is received (default)
+# - lazy: only when something needs to know if it is valid XML
+# - off: never, only check that the response is well formed XML when needed
+VALIDATION_POLICIES = ("eager", "lazy", "off")
+
+# options used by every xml parser, documents never need network access or
+# entity expansion:
+XML_PARSER_OPTIONS = {"no_network": True, "resolve_entities": False}
+
+# the kinds of parsers handed out by get_xml_parser:
+# - etree: plain elements, keeps whitespace so documents serialize unchanged
+# - objectify: objectified elements, blank text removed like objectify.fromstring
+# - result: objectified elements that keep whitespace, RESTResult parses each
+#   response once with this so besxml, besobj and besdict can share the tree
+XML_PARSER_KINDS = ("etree", "objectify", "result")
+
+# huge_tree lifts libxml2 limits on depth and text size (>10MB text nodes)
+xml_huge_tree = False
+
+# lxml parsers must not be shared between threads, so each thread gets its own:
+xml_parsers = threading.local()
+
+
+def set_xml_huge_tree(enabled=True):
+    """Turn huge document mode on or off for all parsers."""
+    global xml_huge_tree  # pylint: disable=global-statement
+    xml_huge_tree = bool(enabled)
+
+
+def get_xml_parser(kind="etree"):
+    """Get the pre-configured xml parser of a kind for the current thread."""
+    parsers = getattr(xml_parsers, "parsers", None)
+    if parsers is None:
+        parsers = xml_parsers.parsers = {}
+
+    parser = parsers.get((kind, xml_huge_tree))
+    if parser is None:
+        if kind == "etree":
+            parser = lxml.etree.XMLParser(
+                remove_blank_text=False, huge_tree=xml_huge_tree, **XML_PARSER_OPTIONS
+            )
+        elif kind in ("objectify", "result"):
+            parser = lxml.objectify.makeparser(
+                remove_blank_text=kind == "objectify",
+                huge_tree=xml_huge_tree,
+                **XML_PARSER_OPTIONS,
+            )
+        else:
+            raise ValueError(
+                f"Unknown parser kind `{kind}`, expected one of {XML_PARSER_KINDS}"
+            )
+        parsers[(kind, xml_huge_tree)] = parser
+
+    return parser
+
+
+def match_xsd(doc):
+    """Get the name of the XSD the document validates against.
+
+    The document can be bytes, a string without an encoding declaration
+    or an already parsed lxml element.
+    Returns None if the document is not XML or does not validate.
+    """
+    if lxml.etree.iselement(doc):
+        xmldoc = doc
+    else:
+        try:
+            xmldoc = lxml.etree.fromstring(doc, get_xml_parser())
+        except BaseException:  # pylint: disable=broad-except
+            return None
+
+    for xsd in schema_registry.candidates(xmldoc.tag):
+        if schema_registry.get(xsd).validate(xmldoc):
+            return xsd
+
+    return None
+
+
+def validate_xsd(doc):
+    """Validate results using XML XSDs."""
+    return match_xsd(doc) is not None
 
 
 def validate_xml_bes_file(file_path):
@@ -249,6 +708,50 @@ def validate_xml_bes_file(file_path):
     return validate_xsd(file_data)
 
 
+def iter_xml_elements(source, tag=None):
+    """Incrementally parse xml from a file like object and yield elements.
+
+    If tag is not provided, the direct children of the root element are yielded,
+    otherwise elements with that tag at any depth are yielded.
+
+    Each element is cleared after the caller is done with it, together with the
+    siblings before it, so memory use stays flat for very large documents.
+    Copy anything that needs to be kept past the current iteration.
+    """
+    # streaming is for very large documents, so always allow huge trees:
+    parse_options = {"huge_tree": True, **XML_PARSER_OPTIONS}
+
+    if tag:
+        for _event, elem in lxml.etree.iterparse(
+            source, events=("end",), tag=tag, **parse_options
+        ):
+            yield elem
+            xml_elem_clear(elem)
+        return
+
+    depth = 0
+    for event, elem in lxml.etree.iterparse(
+        source, events=("start", "end"), **parse_options
+    ):
+        if event == "start":
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield elem
+            xml_elem_clear(elem)
+
+
+def xml_elem_clear(elem):
+    """Free an element and the siblings before it while iterparsing."""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
 def xml_elem_strip_namespace(elem):
     """Strip namespace."""
     clean_elem = lxml.etree.Element(elem.tag, attrib=elem.attrib)
@@ -274,7 +777,7 @@ def action_xml_from_bes_file(file_path, targets="<AllComputers>"):
         logging.error(err_msg)
         raise ValueError(err_msg)
 
-    tree = lxml.etree.parse(file_path)
+    tree = lxml.etree.parse(file_path, get_xml_parser())
 
     # //BES/*[self::Task or self::Fixlet]/*[@id='elid']/name()
     bes_type = str(
@@ -369,25 +872,145 @@ def action_xml_from_bes_file(file_path, targets="<AllComputers>"):
     return action_xml
 
 
-def get_bes_conn_using_env():
-    """Get BESConnection using environment variables."""
+def normalize_rootserver(rootserver):
+    """Get the root server url with https:// and the port, like https://bigfix:52311"""
+    # if not provided, add on https://
+    if not rootserver.startswith("http"):
+        rootserver = "https://" + rootserver
+    # if port not provided, add on the default :52311
+    if not rootserver.count(":") == 2:
+        rootserver = rootserver + ":52311"
+
+    return rootserver
+
+
+def get_bes_conn_using_env(**kwargs):
+    """Get BESConnection using environment variables.
+
+    kwargs are passed on to BESConnection, like thread_safe=True
+    """
     username = os.getenv("BES_USER_NAME")
     password = os.getenv("BES_PASSWORD")
     rootserver = os.getenv("BES_ROOT_SERVER")
 
     if username and password and rootserver:
-        bes_conn = BESConnection(username, password, rootserver)
+        bes_conn = BESConnection(username, password, rootserver, **kwargs)
         if bes_conn:
             return bes_conn
 
     return None
 
 
-def get_bes_conn_using_config_file(conf_file=None):
+def get_file_sha1(file_path):
+    """Get the SHA1 hash of a file, as used to identify uploads."""
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        while True:
+            # read 64k chunks
+            data = f.read(65536)
+            if not data:
+                break
+            sha1.update(data)
+    return sha1.hexdigest()
+
+
+def export_item_content(
+    content,
+    content_resource,
+    export_folder="./",
+    name_trim=100,
+    include_item_type_folder=False,
+    include_item_id=False,
+):
+    """Save the RESTResult of a content item to a bes file named by its title.
+
+    Used by BESConnection.export_item_by_resource, returns the file path.
+    """
+    # get first tag in XML that is the Type
+    content_type_tag = list(content.besobj.__dict__.keys())[0]
+    item_id = int(content_resource.split("/")[-1])
+    item = content.besobj[content_type_tag]
+    # print(item.__dict__.keys())
+    item_folder = export_folder
+    if include_item_type_folder:
+        item_folder = export_folder + "%s" % sanitize_txt(content_type_tag)
+    # print(item_folder)
+    if not os.path.exists(item_folder):
+        os.makedirs(item_folder)
+    item_path = item_folder + "/%s.bes" % sanitize_txt(
+        item.Title.text[:name_trim],
+    )
+    if include_item_id:
+        item_path = item_folder + "/%s-%s.bes" % sanitize_txt(
+            item_id,
+            item.Title.text[:name_trim],
+        )
+    item_path = item_path.replace("//", "/")
+    with open(
+        item_path,
+        "wb",
+    ) as bes_file:
+        bes_file.write(content.content)
+    return item_path
+
+
+def export_site_item_content(
+    content,
+    item,
+    site_path,
+    export_folder="./",
+    name_trim=100,
+    include_site_folder=True,
+    include_item_ids=True,
+):
+    """Save the RESTResult of an item from a site content listing to a bes file.
+
+    item is the element for it in the listing. Used by
+    BESConnection.export_site_contents, returns the file path.
+    """
+    item_folder = export_folder + "%s/%s" % sanitize_txt(site_path, item.tag)
+    if not include_site_folder:
+        item_folder = export_folder + "%s" % sanitize_txt(item.tag)
+    if not os.path.exists(item_folder):
+        os.makedirs(item_folder)
+
+    item_path = export_folder + "%s/%s/%s-%s.bes" % sanitize_txt(
+        site_path,
+        item.tag,
+        item.ID,
+        item.Name.text[:name_trim],
+    )
+    if not include_item_ids:
+        item_path = export_folder + "%s/%s/%s.bes" % sanitize_txt(
+            site_path,
+            item.tag,
+            item.Name.text[:name_trim],
+        )
+    if not include_site_folder:
+        item_path = export_folder + "%s/%s-%s.bes" % sanitize_txt(
+            item.tag,
+            item.ID,
+            item.Name.text[:name_trim],
+        )
+        if not include_item_ids:
+            item_path = export_folder + "%s/%s.bes" % sanitize_txt(
+                item.tag,
+                item.Name.text[:name_trim],
+            )
+    with open(
+        item_path,
+        "wb",
+    ) as bes_file:
+        bes_file.write(content.content)
+    return item_path
+
+
+def get_bes_conn_config(conf_file=None):
     """
     Read connection values from config file.
 
-    return besapi connection
+    return a dict of username, password, rootserver and the optional
+    pool_maxsize and retries, or None if they are not all found.
     """
     config_paths = [
         "/etc/besapi.conf",
@@ -420,8 +1043,41 @@ def get_bes_conn_using_config_file(conf_file=None):
         except BaseException:  # pylint: disable=broad-except
             BES_PASSWORD = None
 
+        # optional connection pool and retry settings:
+        pool_maxsize = configparser_instance.getint(
+            "besapi", "BES_POOL_MAXSIZE", fallback=10
+        )
+        retries = configparser_instance.getint("besapi", "BES_RETRIES", fallback=0)
+        if retries:
+            retries = get_retry(
+                retries,
+                configparser_instance.getfloat(
+                    "besapi", "BES_RETRY_BACKOFF_FACTOR", fallback=0.5
+                ),
+            )
+
         if BES_ROOT_SERVER and BES_USER_NAME and BES_PASSWORD:
-            return BESConnection(BES_USER_NAME, BES_PASSWORD, BES_ROOT_SERVER)
+            return {
+                "username": BES_USER_NAME,
+                "password": BES_PASSWORD,
+                "rootserver": BES_ROOT_SERVER,
+                "pool_maxsize": pool_maxsize,
+                "retries": retries,
+            }
+
+    return None
+
+
+def get_bes_conn_using_config_file(conf_file=None, **kwargs):
+    """
+    Read connection values from config file.
+
+    kwargs are passed on to BESConnection, like thread_safe=True
+    return besapi connection
+    """
+    bes_conn_config = get_bes_conn_config(conf_file)
+    if bes_conn_config:
+        return BESConnection(**{**bes_conn_config, **kwargs})
 
     return None
 
@@ -496,6 +1152,171 @@ def get_bes_conn_interactive(
         return None
 
 
+class RelevanceCache:
+    """Cache of session relevance results with a time to live and a max size.
+
+    Entries older than ttl seconds are not used, and once maxsize entries are
+    stored the least recently used ones are evicted first.
+    Cached results are shared, treat them as read only.
+    """
+
+    def __init__(self, ttl=300, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"Object: besapi.RelevanceCache( {self.stats()} )"
+
+    def get(self, key):
+        """Get a cached result, None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, value = entry
+                if time.monotonic() - stored <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store a result, evicting the least recently used if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, relevance=None):
+        """Remove cached results for a relevance string, or all of them.
+
+        The relevance must match what was sent to the server, note that
+        session_relevance_string wraps the relevance in `(it as string) of`.
+        """
+        with self._lock:
+            if relevance is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+
+            keys = [key for key in self._entries if key[-1] == relevance]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self):
+        """Get hit, miss and eviction counts and the current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+class SingleFlight:
+    """Share one call between threads that make the same call at the same time.
+
+    The first thread to call with a key runs the function, other threads that
+    call with the same key while it is running wait for it and get the same
+    result, or the same exception. Nothing is kept once the call finishes,
+    see RelevanceCache to keep results for longer.
+    Shared results are the same object for every thread, treat them as read only.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Object: besapi.SingleFlight( {self.stats()} )"
+
+    def do(self, key, function, *args, **kwargs):
+        """Call function, or wait for the identical call already in flight."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = concurrent.futures.Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            # another thread is already running this call:
+            return future.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        """Get the number of calls made and calls shared."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "shared": self.shared,
+                "in_flight": len(self._in_flight),
+            }
+
+
+# responses that are worth retrying, like too many requests or the server restarting:
+RETRY_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+
+# POST is only retried for session relevance queries, which don't change anything:
+RETRY_ALLOWED_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def get_retry(
+    retries=3,
+    backoff_factor=0.5,
+    backoff_jitter=0.25,
+    status_forcelist=RETRY_STATUS_FORCELIST,
+    allowed_methods=RETRY_ALLOWED_METHODS,
+):
+    """Get a urllib3 Retry with exponential backoff for BESConnection.
+
+    The wait between attempts doubles each time starting from backoff_factor
+    seconds, with up to backoff_jitter seconds added at random. A Retry-After
+    header from the server is honoured instead when present. After the last
+    retry the final response is returned rather than raising an error.
+    """
+    return urllib3.util.Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        status_forcelist=status_forcelist,
+        allowed_methods=frozenset(allowed_methods),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
 # https://docs.python-requests.org/en/latest/user/advanced/#transport-adapters
 class HTTPAdapterBlocksize(requests.adapters.HTTPAdapter):
     """Custom HTTPAdapter for requests to override blocksize
@@ -543,43 +1364,84 @@ class HTTPAdapterBlocksize(requests.adapters.HTTPAdapter):
 
 
 class BESConnection:
-    """BigFix RESTAPI connection abstraction class."""
+    """BigFix RESTAPI connection abstraction class.
+
+    With thread_safe, one connection can be shared by many threads, like the
+    workers of a ThreadPoolExecutor: login and the main operator check are
+    locked so they only happen once, and the site path context set with
+    set_current_site_path or using_site_path is kept per thread.
+    Also set pool_maxsize to at least the number of threads.
+
+    With lazy_login, there is no login request when the connection is
+    created. Every request sends the credentials anyway, so the first real
+    request authenticates, or call ensure_authenticated to check up front.
+    """
 
-    def __init__(self, username, password, rootserver, verify=False):
+    def __init__(
+        self,
+        username,
+        password,
+        rootserver,
+        verify=False,
+        validation="eager",
+        release_body=False,
+        cache_derived=True,
+        relevance_cache=None,
+        single_flight=False,
+        pool_maxsize=10,
+        retries=0,
+        thread_safe=False,
+        lazy_login=False,
+    ):
+        if validation not in VALIDATION_POLICIES:
+            raise ValueError(
+                f"Invalid validation policy `{validation}`, expected one of {VALIDATION_POLICIES}"
+            )
         if not verify:
             # disable SSL warnings
             requests.packages.urllib3.disable_warnings()  # pylint: disable=no-member
         self.verify = verify
+        # options for the RESTResult of each request:
+        self.validation = validation
+        self.release_body = release_body
+        self.cache_derived = cache_derived
         self.last_connected = None
+        self.lazy_login = lazy_login
+        # set from the status code of each response, not just login:
+        self.authenticated = False
+        self.login_failed = False
+
+        self.thread_safe = thread_safe
+        self._lock = threading.RLock()
+        # site path context of each thread when thread_safe:
+        self._thread_context = threading.local()
+
+        # opt in cache of session relevance results, True for the defaults
+        # or a RelevanceCache, which can be shared between connections.
+        if relevance_cache is True:
+            relevance_cache = RelevanceCache()
+        # an empty RelevanceCache is falsy, so check for False explicitly:
+        self.relevance_cache = None if relevance_cache is False else relevance_cache
+
+        # opt in sharing of identical concurrent read requests between threads,
+        # True for a SingleFlight for this connection or one to share.
+        if single_flight is True:
+            single_flight = SingleFlight()
+        self.single_flight = single_flight or None
 
         self.username = username
         self.session = requests.Session()
         self.session.auth = (username, password)
 
-        # # configure retries for requests
-        # retry = requests.adapters.Retry(
-        #     total=2,
-        #     backoff_factor=0.1,
-        #     # status_forcelist=[500, 502, 503, 504],
-        # )
-
-        # # mount the HTTPAdapter with the retry configuration
-        # self.session.mount("https://", requests.adapters.HTTPAdapter(max_retries=retry))
-
         # store if connection user is main operator
         self.is_main_operator = None
 
         self.webreports_info_xml = None
 
         # use a sitepath context if none specified when required.
-        self.site_path = "master"
+        self._site_path = "master"
 
-        # if not provided, add on https://
-        if not rootserver.startswith("http"):
-            rootserver = "https://" + rootserver
-        # if port not provided, add on the default :52311
-        if not rootserver.count(":") == 2:
-            rootserver = rootserver + ":52311"
+        rootserver = normalize_rootserver(rootserver)
 
         self.rootserver = rootserver
         try:
@@ -589,13 +1451,30 @@ class BESConnection:
             # if error, assume default
             self.rootserver_port = 52311
 
-        self.login()
+        self.mount_adapters(pool_maxsize, retries)
+
+        if not lazy_login:
+            self.login()
 
     def __repr__(self):
         """Object representation."""
         # https://stackoverflow.com/a/2626364/861745
         return f"Object: besapi.BESConnection( username={self.username}, rootserver={self.rootserver} )"
 
+    @property
+    def site_path(self):
+        """Get the site path context, of the current thread if thread_safe."""
+        if self.thread_safe:
+            return getattr(self._thread_context, "site_path", self._site_path)
+        return self._site_path
+
+    @site_path.setter
+    def site_path(self, site_path):
+        if self.thread_safe:
+            self._thread_context.site_path = site_path
+        else:
+            self._site_path = site_path
+
     def __eq__(self, other):
         if (
             self.rootserver == other.rootserver
@@ -611,9 +1490,37 @@ class BESConnection:
         self.session.auth = None
 
     def __bool__(self):
-        """Get true or false."""
+        """Get true or false from the login state.
+
+        No request is made once authenticated. Otherwise a lazy_login
+        connection is true unless a login or any other request has been
+        rejected with 401 Unauthorized, and other connections login again,
+        like after logout.
+        """
+        if self.authenticated:
+            return True
+        if self.lazy_login:
+            return not self.login_failed
         return self.login()
 
+    def ensure_authenticated(self):
+        """Login now unless a request has already been accepted.
+
+        Returns True if authenticated, raises requests.HTTPError if not.
+        """
+        return self.login()
+
+    def _check_authenticated(self, response):
+        """Track whether the credentials were accepted, from a response."""
+        if response.status_code == 401:
+            self.authenticated = False
+            self.login_failed = True
+        elif response.status_code < 500:
+            # anything else but server errors means the credentials were checked:
+            self.authenticated = True
+            self.login_failed = False
+        return response
+
     def url(self, path):
         """Get absolute url."""
         if path.startswith(self.rootserver):
@@ -623,11 +1530,33 @@ class BESConnection:
 
         return url
 
+    def _rest_result(self, response, validation=None):
+        """Wrap a response in a RESTResult using the connection's options."""
+        self._check_authenticated(response)
+        return RESTResult(
+            response,
+            validation or self.validation,
+            self.release_body,
+            self.cache_derived,
+        )
+
+    def _single_flight(self, key, function):
+        """Call function, shared with identical concurrent calls if enabled."""
+        if self.single_flight is None:
+            return function()
+        return self.single_flight.do((self.rootserver, self.username) + key, function)
+
     def get(self, path="help", **kwargs):
         """HTTP GET request."""
-        self.last_connected = datetime.datetime.now()
-        return RESTResult(
-            self.session.get(self.url(path), verify=self.verify, **kwargs)
+
+        def request():
+            self.last_connected = datetime.datetime.now()
+            return self._rest_result(
+                self.session.get(self.url(path), verify=self.verify, **kwargs)
+            )
+
+        return self._single_flight(
+            ("get", self.url(path), repr(sorted(kwargs.items()))), request
         )
 
     def post(self, path, data, validate_xml=None, **kwargs):
@@ -646,7 +1575,7 @@ class BESConnection:
                 besapi_logger.warning(err_msg)
 
         self.last_connected = datetime.datetime.now()
-        return RESTResult(
+        return self._rest_result(
             self.session.post(self.url(path), data=data, verify=self.verify, **kwargs)
         )
 
@@ -666,19 +1595,50 @@ class BESConnection:
                 # this is intended it validate_xml is None, but not used currently
                 besapi_logger.warning(err_msg)
 
-        return RESTResult(
+        return self._rest_result(
             self.session.put(self.url(path), data=data, verify=self.verify, **kwargs)
         )
 
     def delete(self, path, **kwargs):
         """HTTP DELETE request."""
         self.last_connected = datetime.datetime.now()
-        return RESTResult(
+        return self._rest_result(
             self.session.delete(self.url(path), verify=self.verify, **kwargs)
         )
 
+    def iter_get(self, path, tag=None, **kwargs):
+        """HTTP GET request that streams the response and yields xml elements.
+
+        This is for very large listings like `computers` or `actions` that
+        would otherwise be fully loaded into memory by RESTResult.
+        Elements are yielded while the response is still downloading,
+        see iter_xml_elements for what is yielded and how long it is valid.
+        """
+        self.last_connected = datetime.datetime.now()
+        with self.session.get(
+            self.url(path), verify=self.verify, stream=True, **kwargs
+        ) as response:
+            self._check_authenticated(response)
+            if response.status_code == 403:
+                raise PermissionError(
+                    f"\n - HTTP Response Status Code: `403` Forbidden\n - ERROR: `{response.text}`\n - URL: `{response.url}`"
+                )
+            response.raise_for_status()
+
+            # handle gzip or deflate transfer encoding:
+            response.raw.decode_content = True
+            yield from iter_xml_elements(response.raw, tag)
+
     def am_i_main_operator(self):
         """Check if the current user is the main operator user."""
+        with self._lock:
+            self._check_main_operator()
+
+        if self.is_main_operator is not None:
+            return self.is_main_operator
+
+    def _check_main_operator(self):
+        """Check main operator, if not already known."""
         if self.is_main_operator is None:
             try:
                 self.webreports_info_xml = self.get("webreports")
@@ -689,26 +1649,102 @@ class BESConnection:
                 besapi_logger.error("Error checking if main operator: %s", err)
                 self.is_main_operator = None
 
-        if self.is_main_operator is not None:
-            return self.is_main_operator
+    def relevance_cache_key(self, relevance, output):
+        """Get the relevance cache key for a query by this operator."""
+        return (self.rootserver, self.username, output, relevance)
 
     def session_relevance_json(self, relevance, **kwargs):
         """Get Session Relevance Results in JSON.
 
         This will submit the relevance string as json instead of html form data.
         """
+        if self.relevance_cache is not None:
+            cache_key = self.relevance_cache_key(relevance, "json")
+            cached_result = self.relevance_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        def request():
+            session_relevance = urllib.parse.quote(relevance, safe=":+")
+            rel_data = {"output": "json", "relevance": session_relevance}
+            self.last_connected = datetime.datetime.now()
+            # json results are never XML, so don't spend time validating them:
+            result = self._rest_result(
+                self.session.post(
+                    self.url("query"),
+                    data=rel_data,
+                    verify=self.verify,
+                    **kwargs,
+                ),
+                validation="lazy",
+            )
+            return json.loads(result.content)
+
+        json_result = self._single_flight(
+            ("json", relevance, repr(sorted(kwargs.items()))), request
+        )
+
+        # only cache answers, not errors:
+        if self.relevance_cache is not None and "result" in json_result:
+            self.relevance_cache.set(cache_key, json_result)
+
+        return json_result
+
+    def session_relevance_json_iter(
+        self, relevance, metadata=None, chunk_size=65536, **kwargs
+    ):
+        """Get Session Relevance Results in JSON, yielding each result row.
+
+        The response is streamed and parsed incrementally, so very large results
+        never need to be fully loaded into memory. If a metadata dict is
+        provided it is filled with `plural`, `type` and `evaltime_ms` from the
+        response as they are parsed. A singular result, including a singular
+        tuple, is yielded as one row, see iter_json_array.
+        Raises ValueError if the query fails.
+        """
+        if metadata is None:
+            metadata = {}
+
         session_relevance = urllib.parse.quote(relevance, safe=":+")
         rel_data = {"output": "json", "relevance": session_relevance}
         self.last_connected = datetime.datetime.now()
-        result = RESTResult(
-            self.session.post(
-                self.url("query"),
-                data=rel_data,
-                verify=self.verify,
-                **kwargs,
+        with self.session.post(
+            self.url("query"),
+            data=rel_data,
+            verify=self.verify,
+            stream=True,
+            **kwargs,
+        ) as response:
+            self._check_authenticated(response)
+            if response.status_code == 403:
+                raise PermissionError(
+                    f"\n - HTTP Response Status Code: `403` Forbidden\n - ERROR: `{response.text}`\n - URL: `{response.url}`"
+                )
+
+            decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+                errors="replace"
             )
+            chunks = itertools.chain(
+                (decoder.decode(chunk) for chunk in response.iter_content(chunk_size)),
+                (decoder.decode(b"", final=True),),
+            )
+            yield from iter_json_array(chunks, "result", metadata)
+
+        if "error" in metadata:
+            raise ValueError(
+                f"Session relevance query failed: {metadata['error']}\n - Relevance: `{relevance}`"
+            )
+
+    def session_relevance_columns(self, relevance, columns, **kwargs):
+        """Get Session Relevance tuple results as typed columns.
+
+        columns is a list of (name, type) tuples matching the items of the
+        relevance tuple, see relevance_columns.ColumnarResult for the types.
+        Rows are streamed into the columns as they are downloaded.
+        """
+        return relevance_columns.ColumnarResult.from_rows(
+            self.session_relevance_json_iter(relevance, **kwargs), columns
         )
-        return json.loads(result.text)
 
     def session_relevance_json_array(self, relevance, **kwargs):
         """Get Session Relevance Results in an array from the json return.
@@ -729,44 +1765,199 @@ class BESConnection:
         # Ensure each element is converted to a string
         return "\n".join(map(str, rel_result_array))
 
+    def session_relevance_batch(self, relevances, **kwargs):
+        """Get Session Relevance Results for many expressions in one request.
+
+        Returns a list with a dict for each relevance expression, in order:
+        {"relevance": relevance, "result": [answers as strings], "error": None}
+
+        The expressions are combined into a single query. If that fails, each
+        expression is run on its own instead so the error can be reported
+        against the expression that caused it.
+        """
+        relevances = list(relevances)
+        results = [
+            {"relevance": relevance, "result": [], "error": None}
+            for relevance in relevances
+        ]
+        if not relevances:
+            return results
+
+        try:
+            json_result = self.session_relevance_json(
+                get_batch_relevance(relevances), **kwargs
+            )
+        except ValueError as err:
+            # the response was not json
+            json_result = {"error": str(err)}
+
+        if "result" in json_result:
+            for index, answer in get_json_result_list(json_result):
+                results[int(index)]["result"].append(answer)
+            return results
+
+        besapi_logger.info(
+            "Batch of %d relevance expressions failed, running them one at a time: %s",
+            len(relevances),
+            json_result.get("error"),
+        )
+        for result in results:
+            try:
+                json_result = self.session_relevance_json(
+                    f"(it as string) of ( {result['relevance']} )", **kwargs
+                )
+            except ValueError as err:
+                json_result = {"error": str(err)}
+
+            if "result" in json_result:
+                result["result"] = get_json_result_list(json_result)
+            else:
+                result["error"] = json_result.get("error", "Unknown error")
+
+        return results
+
+    def session_relevance_json_parallel(self, relevances, max_workers=4, **kwargs):
+        """Run session relevance queries in parallel threads.
+
+        Yields a tuple of (relevance, json result) as each query finishes, which
+        might not be the order they were given in.
+        No more than max_workers queries are sent to the server at once.
+        """
+        relevances = iter(relevances)
+        pending = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit_next(count):
+                for relevance in itertools.islice(relevances, count):
+                    future = executor.submit(
+                        self.session_relevance_json, relevance, **kwargs
+                    )
+                    pending[future] = relevance
+
+            submit_next(max_workers)
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    relevance = pending.pop(future)
+                    # start the next query before handing over this result:
+                    submit_next(1)
+                    yield relevance, future.result()
+
+    def session_relevance_sharded(
+        self, relevance, shard_filters, max_workers=4, **kwargs
+    ):
+        """Get Session Relevance Results for a large query split into shards.
+
+        The relevance must contain `{shard}` where each of the shard_filters
+        should go, for example:
+        `(id of it, name of it) of bes computers whose({shard})`
+
+        See get_modulo_shard_filters and get_range_shard_filters, or use a
+        filter per site or anything else that splits up the results.
+        The shards are run in parallel, no more than max_workers at once, and the
+        result rows are yielded as each shard finishes.
+        """
+        if "{shard}" not in relevance:
+            raise ValueError("relevance must contain `{shard}` to shard the query")
+
+        shard_relevances = (
+            relevance.replace("{shard}", f"({shard_filter})")
+            for shard_filter in shard_filters
+        )
+        for shard_relevance, json_result in self.session_relevance_json_parallel(
+            shard_relevances, max_workers, **kwargs
+        ):
+            if "result" not in json_result:
+                raise ValueError(
+                    f"Shard query failed: {json_result.get('error')}\n - Relevance: `{shard_relevance}`"
+                )
+            shard_result = get_json_result_list(json_result)
+            besapi_logger.debug(
+                "Shard returned %d results: %s", len(shard_result), shard_relevance
+            )
+            yield from shard_result
+
+    def session_relevance_set_membership(
+        self,
+        relevance,
+        values,
+        chunk_size=500,
+        max_workers=4,
+        max_length=20000,
+        **kwargs,
+    ):
+        """Get Session Relevance Results for items matching a large list of values.
+
+        The relevance must contain `{values}` where the set of values goes,
+        for example to get computer ids from a list of names or ids:
+        `unique values of ids of bes computers whose(exists elements of
+        intersections of (it; sets of ({values})) of sets of (name of it;
+        id of it as string))`
+
+        The values are split into chunks, see get_relevance_set_chunks, which
+        are queried in parallel. Returns a list of the results of all chunks
+        with duplicates removed.
+        """
+        if "{values}" not in relevance:
+            raise ValueError("relevance must contain `{values}` for the set of values")
+
+        chunk_relevances = (
+            relevance.replace("{values}", chunk)
+            for chunk in get_relevance_set_chunks(values, chunk_size, max_length)
+        )
+        results = []
+        seen = set()
+        for chunk_relevance, json_result in self.session_relevance_json_parallel(
+            chunk_relevances, max_workers, **kwargs
+        ):
+            if "result" not in json_result:
+                raise ValueError(
+                    f"Set membership query failed: {json_result.get('error')}\n - Relevance: `{chunk_relevance[:200]}`"
+                )
+            for item in get_json_result_list(json_result):
+                # tuple results are lists, which can not be in a set:
+                key = json.dumps(item)
+                if key not in seen:
+                    seen.add(key)
+                    results.append(item)
+
+        return results
+
     def session_relevance_xml(self, relevance, **kwargs):
         """Get Session Relevance Results XML."""
-        self.last_connected = datetime.datetime.now()
-        return RESTResult(
-            self.session.post(
-                self.url("query"),
-                data=f"relevance={urllib.parse.quote(relevance, safe=':')}",
-                verify=self.verify,
-                **kwargs,
+        if self.relevance_cache is not None:
+            cache_key = self.relevance_cache_key(relevance, "xml")
+            cached_result = self.relevance_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        def request():
+            self.last_connected = datetime.datetime.now()
+            return self._rest_result(
+                self.session.post(
+                    self.url("query"),
+                    data=f"relevance={urllib.parse.quote(relevance, safe=':')}",
+                    verify=self.verify,
+                    **kwargs,
+                )
             )
+
+        result = self._single_flight(
+            ("xml", relevance, repr(sorted(kwargs.items()))), request
         )
 
+        if self.relevance_cache is not None and result.status_code == 200:
+            self.relevance_cache.set(cache_key, result)
+
+        return result
+
     def session_relevance_array(self, relevance, **kwargs):
         """Get Session Relevance Results array."""
         rel_result = self.session_relevance_xml(relevance, **kwargs)
         # print(rel_result)
-        result = []
-        try:
-            for item in rel_result.besobj.Query.Result.Answer:
-                result.append(item.text)
-        except AttributeError as err:
-            # print(err)
-            if "no such child: Answer" in str(err):
-                try:
-                    result.append("ERROR: " + rel_result.besobj.Query.Error.text)
-                except AttributeError as err2:
-                    if "no such child: Error" in str(err2):
-                        result.append("<Nothing> Nothing returned, but no error.")
-                        besapi_logger.info("Query did not return any results")
-                    else:
-                        besapi_logger.error("%s\n%s", err2, rel_result.text)
-                        result.append("ERROR: " + rel_result.text)
-                        raise
-            else:
-                besapi_logger.error("%s\n%s", err, rel_result.text)
-                result.append("ERROR: " + rel_result.text)
-                raise
-        return result
+        return get_relevance_answers(rel_result)
 
     def session_relevance_string(self, relevance, **kwargs):
         """Get Session Relevance Results string."""
@@ -775,8 +1966,55 @@ class BESConnection:
         )
         return "\n".join(rel_result_array)
 
+    def mount_adapters(self, pool_maxsize=10, retries=0):
+        """Set the connection pool size and retries for the root server.
+
+        pool_maxsize should be at least the number of threads using this
+        connection at once. retries is a number of retries with the defaults
+        of get_retry, or a urllib3 Retry. Session relevance queries are also
+        retried for POST, since they don't change anything.
+        """
+        if retries and not isinstance(retries, urllib3.util.Retry):
+            retries = get_retry(retries)
+
+        query_retries = retries
+        if retries and retries.allowed_methods is not None:
+            query_retries = retries.new(
+                allowed_methods=retries.allowed_methods | {"POST"}
+            )
+
+        self.session.mount(
+            self.rootserver,
+            requests.adapters.HTTPAdapter(
+                pool_maxsize=pool_maxsize, max_retries=retries
+            ),
+        )
+        self.session.mount(
+            self.url("query"),
+            requests.adapters.HTTPAdapter(
+                pool_maxsize=pool_maxsize, max_retries=query_retries
+            ),
+        )
+
+        # uploads are POST, which is not retried, but checking for an
+        # existing upload is a GET that is.
+        # This doesn't work until urllib3 is at least ~v2:
+        try:
+            self.session.mount(
+                self.url("upload"),
+                HTTPAdapterBlocksize(pool_maxsize=pool_maxsize, max_retries=retries),
+            )
+        except Exception:  # pylint: disable=broad-except
+            pass
+
     def login(self, timeout=(3, 20)):
         """Do login."""
+        # only one thread should login at a time:
+        with self._lock:
+            return self._login(timeout)
+
+    def _login(self, timeout):
+        """Do login, with the lock held."""
         if bool(self.last_connected):
             duration_obj = datetime.datetime.now() - self.last_connected
             duration_minutes = duration_obj / datetime.timedelta(minutes=1)
@@ -792,27 +2030,27 @@ class BESConnection:
             #     besapi_logger.info("Refreshing Login to prevent timeout.")
             #     self.last_connected = None
 
-        if not bool(self.last_connected):
+        # login unless a request has already been accepted:
+        if not self.authenticated:
             result_login = self.get("login", timeout=timeout)
-            if not result_login.request.status_code == 200:
+            if not result_login.status_code == 200:
+                self.authenticated = False
+                self.login_failed = True
+                # the request itself set last_connected:
+                self.last_connected = None
                 result_login.request.raise_for_status()
-            if result_login.request.status_code == 200:
+            if result_login.status_code == 200:
                 # set time of connection
                 self.last_connected = datetime.datetime.now()
 
-        # This doesn't work until urllib3 is at least ~v2:
-        if self.last_connected:
-            try:
-                self.session.mount(self.url("upload"), HTTPAdapterBlocksize())
-            except Exception:  # pylint: disable=broad-except
-                pass
-
-        return bool(self.last_connected)
+        return self.authenticated
 
     def logout(self):
         """Clear session and close it."""
         self.session.cookies.clear()
         self.session.close()
+        self.last_connected = None
+        self.authenticated = False
 
     def set_dashboard_variable_value(
         self, dashboard_name, var_name, var_value, private=False
@@ -870,7 +2108,7 @@ class BESConnection:
 
                 # check site exists first
                 site_result = self.get(f"site/{site_path}")
-                if site_result.request.status_code != 200:
+                if site_result.status_code != 200:
                     besapi_logger.info("Site `%s` does not exist", site_path)
                     if not raise_error:
                         return None
@@ -902,7 +2140,7 @@ class BESConnection:
         return self.validate_site_path(site_path, check_site_exists=False)
 
     def set_current_site_path(self, site_path):
-        """Set current site path context."""
+        """Set current site path context, for the current thread if thread_safe."""
 
         if self.validate_site_path(site_path):
             self.site_path = site_path
@@ -910,6 +2148,19 @@ class BESConnection:
 
         return None
 
+    @contextlib.contextmanager
+    def using_site_path(self, site_path):
+        """Use a site path context for a block of code, then restore it.
+
+        example: `with bes_conn.using_site_path("custom/Example"):`
+        """
+        previous_site_path = self.site_path
+        self.site_path = self.validate_site_path(site_path, check_site_exists=False)
+        try:
+            yield self.site_path
+        finally:
+            self.site_path = previous_site_path
+
     def import_bes_to_site(self, bes_file_path, site_path=None):
         """Import bes file to site."""
 
@@ -935,7 +2186,7 @@ class BESConnection:
 
     def create_site_from_file(self, bes_file_path, site_type="custom"):
         """Create new site."""
-        xml_parsed = lxml.etree.parse(bes_file_path)
+        xml_parsed = lxml.etree.parse(bes_file_path, get_xml_parser())
         new_site_name = xml_parsed.xpath("/BES/CustomSite/Name/text()")[0]
 
         result_site_path = self.validate_site_path(
@@ -962,7 +2213,7 @@ class BESConnection:
 
     def create_user_from_file(self, bes_file_path):
         """Create user from xml."""
-        xml_parsed = lxml.etree.parse(bes_file_path)
+        xml_parsed = lxml.etree.parse(bes_file_path, get_xml_parser())
         new_user_name = xml_parsed.xpath("/BESAPI/Operator/Name/text()")[0]
         result_user = self.get_user(new_user_name)
 
@@ -993,7 +2244,7 @@ class BESConnection:
     def create_group_from_file(self, bes_file_path, site_path=None):
         """Create a new group."""
         site_path = self.get_current_site_path(site_path)
-        xml_parsed = lxml.etree.parse(bes_file_path)
+        xml_parsed = lxml.etree.parse(bes_file_path, get_xml_parser())
         new_group_name = xml_parsed.xpath("/BES/ComputerGroup/Title/text()")[0]
 
         existing_group = self.get_computergroup(new_group_name, site_path)
@@ -1032,7 +2283,7 @@ class BESConnection:
         else:
             raise ValueError("No file_name specified. Must be at least one character.")
 
-        if "Upload not found" in result.text:
+        if b"Upload not found" in result.content:
             besapi_logger.debug("WARNING: Upload not found!")
             return None
 
@@ -1063,15 +2314,7 @@ class BESConnection:
             besapi_logger.warning(
                 "SHA1 hash of file to be uploaded not provided, calculating it."
             )
-            sha1 = hashlib.sha1()
-            with open(file_path, "rb") as f:
-                while True:
-                    # read 64k chunks
-                    data = f.read(65536)
-                    if not data:
-                        break
-                    sha1.update(data)
-            file_hash = sha1.hexdigest()
+            file_hash = get_file_sha1(file_path)
 
         check_upload = None
         if file_hash:
@@ -1136,7 +2379,7 @@ class BESConnection:
     def update_item_from_file(self, file_path, site_path=None):
         """Update an item by name and last modified."""
         site_path = self.get_current_site_path(site_path)
-        bes_tree = lxml.etree.parse(file_path)
+        bes_tree = lxml.etree.parse(file_path, get_xml_parser())
 
         with open(file_path, "rb") as f:
             content = f.read()
@@ -1167,7 +2410,7 @@ class BESConnection:
         export_folder="./",
         name_trim=100,
     ):
-        """Save an xml string to bes file."""
+        """Save an xml string or bytes to bes file."""
         item_folder = export_folder
         if not os.path.exists(item_folder):
             os.makedirs(item_folder)
@@ -1184,7 +2427,9 @@ class BESConnection:
             item_path,
             "wb",
         ) as bes_file:
-            bes_file.write(xml_string.encode("utf-8"))
+            if isinstance(xml_string, str):
+                xml_string = xml_string.encode("utf-8")
+            bes_file.write(xml_string)
         return item_path
 
     def export_item_by_resource(
@@ -1209,32 +2454,14 @@ class BESConnection:
             besapi_logger.warning("Content not found")
             return None
 
-        # get first tag in XML that is the Type
-        content_type_tag = list(content.besobj.__dict__.keys())[0]
-        item_id = int(content_resource.split("/")[-1])
-        item = content.besobj[content_type_tag]
-        # print(item.__dict__.keys())
-        item_folder = export_folder
-        if include_item_type_folder:
-            item_folder = export_folder + "%s" % sanitize_txt(content_type_tag)
-        # print(item_folder)
-        if not os.path.exists(item_folder):
-            os.makedirs(item_folder)
-        item_path = item_folder + "/%s.bes" % sanitize_txt(
-            item.Title.text[:name_trim],
+        return export_item_content(
+            content,
+            content_resource,
+            export_folder,
+            name_trim,
+            include_item_type_folder,
+            include_item_id,
         )
-        if include_item_id:
-            item_path = item_folder + "/%s-%s.bes" % sanitize_txt(
-                item_id,
-                item.Title.text[:name_trim],
-            )
-        item_path = item_path.replace("//", "/")
-        with open(
-            item_path,
-            "wb",
-        ) as bes_file:
-            bes_file.write(content.text.encode("utf-8"))
-        return item_path
 
     def export_site_contents(
         self,
@@ -1259,7 +2486,7 @@ class BESConnection:
         content = self.get("site/" + site_path + "/content")
         if verbose:
             print(content)
-        if content.request.status_code == 200:
+        if content.status_code == 200:
             print(
                 "Archiving %d items from %s..." % (content().countchildren(), site_path)
             )
@@ -1283,43 +2510,15 @@ class BESConnection:
                 if not content:
                     continue
 
-                # Write Content to Disk
-                item_folder = export_folder + "%s/%s" % sanitize_txt(
-                    site_path, item.tag
-                )
-                if not include_site_folder:
-                    item_folder = export_folder + "%s" % sanitize_txt(item.tag)
-                if not os.path.exists(item_folder):
-                    os.makedirs(item_folder)
-
-                item_path = export_folder + "%s/%s/%s-%s.bes" % sanitize_txt(
+                export_site_item_content(
+                    content,
+                    item,
                     site_path,
-                    item.tag,
-                    item.ID,
-                    item.Name.text[:name_trim],
+                    export_folder,
+                    name_trim,
+                    include_site_folder,
+                    include_item_ids,
                 )
-                if not include_item_ids:
-                    item_path = export_folder + "%s/%s/%s.bes" % sanitize_txt(
-                        site_path,
-                        item.tag,
-                        item.Name.text[:name_trim],
-                    )
-                if not include_site_folder:
-                    item_path = export_folder + "%s/%s-%s.bes" % sanitize_txt(
-                        item.tag,
-                        item.ID,
-                        item.Name.text[:name_trim],
-                    )
-                    if not include_item_ids:
-                        item_path = export_folder + "%s/%s.bes" % sanitize_txt(
-                            item.tag,
-                            item.Name.text[:name_trim],
-                        )
-                with open(
-                    item_path,
-                    "wb",
-                ) as bes_file:
-                    bes_file.write(content.text.encode("utf-8"))
 
     def export_all_sites(
         self, include_external=False, export_folder="./", name_trim=70, verbose=False
@@ -1328,7 +2527,7 @@ class BESConnection:
         results_sites = self.get("sites")
         if verbose:
             print(results_sites)
-        if results_sites.request.status_code == 200:
+        if results_sites.status_code == 200:
             for item in results_sites().iterchildren():
                 site_path = item.attrib["Resource"].split("/api/site/", 1)[1]
                 if include_external or "external/" not in site_path:
@@ -1343,14 +2542,64 @@ class BESConnection:
 
 
 class RESTResult:
-    """BigFix REST API Result Abstraction Class."""
+    """BigFix REST API Result Abstraction Class.
+
+    With release_body, the response and its raw body are dropped once they
+    have been parsed into besroot, use status_code, url and headers instead
+    of request after that. With cache_derived set to False, besxml, besdict
+    and besjson are built from besroot each time instead of being kept.
+    """
+
+    __slots__ = (
+        "request",
+        "_content",
+        "encoding",
+        "status_code",
+        "url",
+        "headers",
+        "validation",
+        "release_body",
+        "cache_derived",
+        "_valid_xsd",
+        "_text",
+        "_valid",
+        "_besroot",
+        "_besxml",
+        "_besdict",
+        "_besjson",
+    )
 
-    def __init__(self, request):
+    def __init__(
+        self, request, validation="eager", release_body=False, cache_derived=True
+    ):
+        if validation not in VALIDATION_POLICIES:
+            raise ValueError(
+                f"Invalid validation policy `{validation}`, expected one of {VALIDATION_POLICIES}"
+            )
         self.request = request
-        self.text = request.text
-        self.valid = None
+        self._text = None
+        # work from the raw response bytes, only decode if .text is used
+        self._content = getattr(request, "content", None)
+        self.encoding = getattr(request, "encoding", None) or "utf-8"
+        if self._content is None:
+            # not a requests.Response, like the objects used in tests
+            self._text = request.text
+            self._content = (
+                request.text.encode("utf-8")
+                if type(request.text) is str
+                else request.text
+            )
+        self.status_code = getattr(request, "status_code", None)
+        self.url = getattr(request, "url", None)
+        self.headers = request.headers
+        self.validation = validation
+        self.release_body = release_body
+        self.cache_derived = cache_derived
+        self._valid = None
+        # None until worked out, False if no XSD matched:
+        self._valid_xsd = None
+        self._besroot = None
         self._besxml = None
-        self._besobj = None
         self._besdict = None
         self._besjson = None
 
@@ -1374,19 +2623,89 @@ class RESTResult:
             "content-type" in request.headers
             and request.headers["content-type"] == "application/xml"
         ):
-            self.valid = True
-        elif type(request.text) is str and self.validate_xsd(
-            request.text.encode("utf-8")
-        ):
-            self.valid = True
-        else:
-            if self.validate_xsd(request.text):
-                self.valid = True
-            else:
-                besapi_logger.debug(
-                    "INFO: REST API Result does not appear to be XML, this could be expected."
-                )
-                self.valid = False
+            self._valid = True
+        elif self.validation == "eager":
+            self._valid = self.check_valid()
+
+    @property
+    def content(self):
+        """Property for the raw response body as bytes.
+
+        If the body has been released, it is serialized again from besroot.
+        """
+        if self._content is None:
+            return lxml.etree.tostring(
+                self._besroot, encoding="utf-8", xml_declaration=True
+            )
+
+        return self._content
+
+    @property
+    def text(self):
+        """Property for the response body decoded to a string.
+
+        This is only decoded the first time it is used. If the body has been
+        released, it is serialized again from besroot.
+        """
+        if self._text is not None:
+            return self._text
+
+        if self._content is None:
+            return lxml.etree.tostring(self._besroot, encoding="unicode")
+
+        text = self._content.decode(self.encoding, errors="replace")
+        if self.cache_derived:
+            self._text = text
+
+        return text
+
+    @property
+    def valid(self):
+        """Property for whether the result is valid XML.
+
+        With lazy or off validation this is only worked out on first use.
+        """
+        if self._valid is None:
+            self._valid = self.check_valid()
+
+        return self._valid
+
+    @valid.setter
+    def valid(self, value):
+        self._valid = value
+
+    @property
+    def valid_xsd(self):
+        """Property for the name of the XSD the result matched, None if none did.
+
+        Validation is skipped for application/xml results and with the off
+        policy, so then this is only worked out on first use.
+        """
+        if self._valid_xsd is None:
+            self._valid_xsd = False
+            if self.besroot is not None:
+                self._valid_xsd = match_xsd(self.besroot) or False
+
+        return self._valid_xsd or None
+
+    def check_valid(self):
+        """Check if the result text is XML according to the validation policy.
+
+        The `off` policy only checks that the text is well formed XML.
+        """
+        root_xml = self.besroot
+
+        if root_xml is not None:
+            if self.validation == "off":
+                return True
+
+            if self.validate_xsd(root_xml):
+                return True
+
+        besapi_logger.debug(
+            "INFO: REST API Result does not appear to be XML, this could be expected."
+        )
+        return False
 
     def __str__(self):
         if self.valid:
@@ -1401,52 +2720,202 @@ class RESTResult:
     def __call__(self):
         return self.besobj
 
+    @property
+    def besroot(self):
+        """Property for the parsed xml tree the other representations share.
+
+        The response is only parsed once, this is None if it is not xml.
+        """
+        if self._besroot is None:
+            try:
+                self._besroot = lxml.etree.fromstring(
+                    self._content, get_xml_parser("result")
+                )
+            except BaseException:  # pylint: disable=broad-except
+                # remember that parsing failed so it is not tried again
+                self._besroot = False
+            else:
+                if self.release_body:
+                    self.release()
+
+        if self._besroot is False:
+            return None
+
+        return self._besroot
+
+    def release(self):
+        """Drop the response and raw body, keeping only the parsed tree.
+
+        Does nothing if the body is not xml, because then it is all there is.
+        """
+        if self.besroot is None:
+            return False
+
+        self.request = None
+        self._content = None
+        self._text = None
+        return True
+
     @property
     def besxml(self):
         """Property for parsed xml representation."""
-        if self.valid and self._besxml is None:
-            self._besxml = self.xmlparse_text(self.text)
+        if self._besxml is not None:
+            return self._besxml
 
-        return self._besxml
+        besxml = None
+        if self.valid:
+            besxml = self.xmlparse_text(self.besroot)
+            if self.cache_derived:
+                self._besxml = besxml
+
+        return besxml
 
     @property
     def besobj(self):
-        """Property for xml object representation."""
-        if self.valid and self._besobj is None:
-            self._besobj = self.objectify_text(self.text)
+        """Property for xml object representation.
 
-        return self._besobj
+        This is the shared besroot tree, with whitespace kept as it was in
+        the response. Changes to it show up in besxml, besdict and besjson,
+        and in text after release, so treat it as read only.
+        """
+        if self.valid:
+            return self.besroot
+
+        return None
 
     @property
     def besdict(self):
         """Property for python dict representation."""
-        if self._besdict is None:
-            if self.valid:
-                self._besdict = elem2dict(lxml.etree.fromstring(self.besxml))
-            else:
-                self._besdict = {"text": str(self)}
+        if self._besdict is not None:
+            return self._besdict
+
+        if self.valid:
+            besdict = elem2dict(self.besroot)
+        else:
+            besdict = {"text": str(self)}
+        if self.cache_derived:
+            self._besdict = besdict
+
+        return besdict
+
+    def to_dict(self, attributes=False, force_list=()):
+        """Get a python dict representation with elem2dict options.
+
+        Unlike besdict, the result is never cached.
+        """
+        if self.valid:
+            return elem2dict(self.besroot, attributes, force_list)
+
+        return {"text": str(self)}
+
+    def write_json(
+        self, file, indent=None, lines=False, attributes=False, force_list=()
+    ):
+        """Write the json representation to a file like object.
+
+        This writes one child element of the root at a time instead of building
+        the whole dict and json string in memory. With indent=2 the output is
+        the same as besjson, without indent it is compact.
+        With lines, write JSON Lines instead, see write_json_elements.
+        """
+        if not self.valid:
+            file.write(json_dumps_nested({"text": str(self)}, indent))
+            if lines:
+                file.write("\n")
+            return
+
+        if lines:
+            write_json_elements(
+                self.besroot.iterchildren(lxml.etree.Element),
+                file,
+                attributes,
+                force_list,
+            )
+            return
+
+        # group repeated tags together, the same way elem2dict does:
+        members = {}
+        if attributes:
+            members = {
+                name: [value]
+                for name, value in elem2dict_attributes(self.besroot, {}).items()
+            }
+        for element in self.besroot.iterchildren(lxml.etree.Element):
+            # Remove namespace prefix
+            key = element.tag.split("}")[1] if "}" in element.tag else element.tag
+            members.setdefault(key, []).append(element)
+
+        if not members:
+            file.write("{}")
+            return
+
+        newline = "" if indent is None else "\n"
+        key_separator = ":" if indent is None else ": "
+        file.write("{")
+        for member_number, (key, values) in enumerate(members.items()):
+            if member_number:
+                file.write(",")
+            file.write(newline + " " * (indent or 0))
+            file.write(json.dumps(key) + key_separator)
+
+            if len(values) == 1 and key not in force_list:
+                file.write(
+                    json_dumps_nested(
+                        self.json_member_value(values[0], attributes, force_list),
+                        indent,
+                        1,
+                    )
+                )
+                continue
+
+            file.write("[")
+            for value_number, value in enumerate(values):
+                if value_number:
+                    file.write(",")
+                file.write(newline + " " * 2 * (indent or 0))
+                file.write(
+                    json_dumps_nested(
+                        self.json_member_value(value, attributes, force_list),
+                        indent,
+                        2,
+                    )
+                )
+            file.write(newline + " " * (indent or 0) + "]")
 
-        return self._besdict
+        file.write(newline + "}")
+
+    @staticmethod
+    def json_member_value(value, attributes=False, force_list=()):
+        """Convert an element for write_json, attribute values are strings."""
+        if isinstance(value, str):
+            return value
+
+        return elem2dict_value(value, attributes, force_list)
 
     @property
     def besjson(self):
         """Property for json representation."""
-        if self._besjson is None:
-            self._besjson = json.dumps(self.besdict, indent=2)
+        if self._besjson is not None:
+            return self._besjson
+
+        besjson = json.dumps(self.besdict, indent=2)
+        if self.cache_derived:
+            self._besjson = besjson
 
-        return self._besjson
+        return besjson
 
     def validate_xsd(self, doc):
         """Validate results using XML XSDs."""
         # return self.valid if already set
-        if self.valid is not None and isinstance(self.valid, bool):
-            return self.valid
-        return validate_xsd(doc)
+        if self._valid is not None and isinstance(self._valid, bool):
+            return self._valid
+        self._valid_xsd = match_xsd(doc) or False
+        return self._valid_xsd is not False
 
     def xmlparse_text(self, text):
         """Parse response text as xml."""
         if type(text) is str:
-            root_xml = lxml.etree.fromstring(text.encode("utf-8"))
+            root_xml = lxml.etree.fromstring(text.encode("utf-8"), get_xml_parser())
         else:
             root_xml = text
 
@@ -1459,7 +2928,7 @@ class RESTResult:
         else:
             root_xml = text
 
-        return lxml.objectify.fromstring(root_xml)
+        return lxml.objectify.fromstring(root_xml, get_xml_parser("objectify"))
 
 
 def main():
@@ -0,0 +1,435 @@
+"""Asyncio version of BESConnection, for many concurrent requests from one process.
+
+requires aiohttp, install with command `pip install besapi[async]`
+
+Results are the same RESTResult objects that BESConnection returns.
+
+Example:
+    async with besapi.besapi_async.get_async_bes_conn_using_config_file() as bes_conn:
+        results = await bes_conn.get_many(resources, max_concurrent=20)
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import ssl
+import urllib.parse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import requests
+
+import besapi
+
+besapi_logger = logging.getLogger("besapi")
+
+
+class AsyncResponse:
+    """The parts of a finished aiohttp response that RESTResult uses.
+
+    This has the same attributes as a requests.Response for those parts.
+    """
+
+    def __init__(self, response, content):
+        self.content = content
+        self.encoding = response.charset or "utf-8"
+        self.status_code = response.status
+        self.reason = response.reason
+        self.url = str(response.url)
+        self.headers = response.headers
+
+    @property
+    def text(self):
+        """Get the response body as a string."""
+        return self.content.decode(self.encoding, errors="replace")
+
+    def raise_for_status(self):
+        """Raise requests.HTTPError for 4xx and 5xx responses, like requests."""
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                f"{self.status_code} Error: {self.reason} for url: {self.url}"
+            )
+
+
+class AsyncBESConnection:
+    """BigFix RESTAPI connection using asyncio and aiohttp.
+
+    Use it with `async with` so the aiohttp session is closed at the end, or
+    call close() when done with it. Requests are not retried, see
+    BESConnection retries for that.
+    """
+
+    def __init__(
+        self,
+        username,
+        password,
+        rootserver,
+        verify=False,
+        validation="eager",
+        release_body=False,
+        cache_derived=True,
+        pool_maxsize=10,
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncBESConnection requires aiohttp, install with `pip install besapi[async]`"
+            )
+        if validation not in besapi.besapi.VALIDATION_POLICIES:
+            raise ValueError(
+                f"Invalid validation policy `{validation}`, expected one of {besapi.besapi.VALIDATION_POLICIES}"
+            )
+        self.username = username
+        self.password = password
+        self.rootserver = besapi.besapi.normalize_rootserver(rootserver)
+        self.verify = verify
+        # options for the RESTResult of each request:
+        self.validation = validation
+        self.release_body = release_body
+        self.cache_derived = cache_derived
+        self.pool_maxsize = pool_maxsize
+        self.last_connected = None
+        self.session = None
+
+    def __repr__(self):
+        """Object representation."""
+        return f"Object: besapi.AsyncBESConnection( username={self.username}, rootserver={self.rootserver} )"
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, *_exc_info):
+        await self.close()
+
+    def url(self, path):
+        """Get absolute url."""
+        if path.startswith(self.rootserver):
+            return path
+
+        return f"{self.rootserver}/api/{path}"
+
+    def get_ssl(self):
+        """Get the aiohttp ssl option for verify, which works like in requests.
+
+        verify can be True, False or the path to a CA bundle file or folder.
+        """
+        if isinstance(self.verify, str):
+            if os.path.isdir(self.verify):
+                return ssl.create_default_context(capath=self.verify)
+            return ssl.create_default_context(cafile=self.verify)
+
+        return bool(self.verify)
+
+    def get_session(self):
+        """Get the aiohttp session, which is created on first use."""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(self.username, self.password),
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_maxsize, ssl=self.get_ssl()
+                ),
+                # allow cookies from root servers that are IP addresses:
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+            )
+        return self.session
+
+    async def request(self, method, path, validation=None, **kwargs):
+        """HTTP request of any method, returns a RESTResult."""
+        self.last_connected = datetime.datetime.now()
+        async with self.get_session().request(
+            method, self.url(path), **kwargs
+        ) as response:
+            content = await response.read()
+
+        return besapi.besapi.RESTResult(
+            AsyncResponse(response, content),
+            validation or self.validation,
+            self.release_body,
+            self.cache_derived,
+        )
+
+    async def get(self, path="help", **kwargs):
+        """HTTP GET request."""
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, data, validate_xml=None, **kwargs):
+        """HTTP POST request."""
+        if validate_xml and not besapi.besapi.validate_xsd(data):
+            err_msg = "data being posted did not validate to XML schema. If expected, consider setting validate_xml to false."
+            besapi_logger.error(err_msg)
+            raise ValueError(err_msg)
+
+        return await self.request("POST", path, data=data, **kwargs)
+
+    async def put(self, path, data, validate_xml=None, **kwargs):
+        """HTTP PUT request."""
+        if validate_xml and not besapi.besapi.validate_xsd(data):
+            err_msg = "data being put did not validate to XML schema. If expected, consider setting validate_xml to false."
+            besapi_logger.error(err_msg)
+            raise ValueError(err_msg)
+
+        return await self.request("PUT", path, data=data, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        """HTTP DELETE request."""
+        return await self.request("DELETE", path, **kwargs)
+
+    async def get_many(self, paths, max_concurrent=10, return_exceptions=False):
+        """HTTP GET many paths concurrently, returns RESTResults in order.
+
+        No more than max_concurrent requests are made at once.
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def limited_get(path):
+            async with semaphore:
+                return await self.get(path)
+
+        return await asyncio.gather(
+            *(limited_get(path) for path in paths),
+            return_exceptions=return_exceptions,
+        )
+
+    async def login(self, timeout=30):
+        """Do login."""
+        result_login = await self.get(
+            "login", timeout=aiohttp.ClientTimeout(total=timeout)
+        )
+        if not result_login.status_code == 200:
+            result_login.request.raise_for_status()
+        self.last_connected = datetime.datetime.now()
+        return True
+
+    async def close(self):
+        """Clear session and close it."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def session_relevance_json(self, relevance, **kwargs):
+        """Get Session Relevance Results in JSON."""
+        session_relevance = urllib.parse.quote(relevance, safe=":+")
+        rel_data = {"output": "json", "relevance": session_relevance}
+        # json results are never XML, so don't spend time validating them:
+        result = await self.request(
+            "POST", "query", validation="lazy", data=rel_data, **kwargs
+        )
+        return json.loads(result.content)
+
+    async def session_relevance_json_array(self, relevance, **kwargs):
+        """Get Session Relevance Results in an array from the json return."""
+        result = await self.session_relevance_json(relevance, **kwargs)
+        return result["result"]
+
+    async def session_relevance_json_string(self, relevance, **kwargs):
+        """Get Session Relevance Results in a string from the json return."""
+        rel_result_array = await self.session_relevance_json_array(relevance, **kwargs)
+        return "\n".join(map(str, rel_result_array))
+
+    async def session_relevance_xml(self, relevance, **kwargs):
+        """Get Session Relevance Results XML."""
+        return await self.post(
+            "query",
+            data=f"relevance={urllib.parse.quote(relevance, safe=':')}",
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            **kwargs,
+        )
+
+    async def session_relevance_array(self, relevance, **kwargs):
+        """Get Session Relevance Results array."""
+        rel_result = await self.session_relevance_xml(relevance, **kwargs)
+        return besapi.besapi.get_relevance_answers(rel_result)
+
+    async def session_relevance_string(self, relevance, **kwargs):
+        """Get Session Relevance Results string."""
+        rel_result_array = await self.session_relevance_array(
+            "(it as string) of ( " + relevance + " )", **kwargs
+        )
+        return "\n".join(rel_result_array)
+
+    async def get_upload(self, file_name, file_hash):
+        """Check for a specific file upload reference."""
+        if len(file_hash) != 40:
+            raise ValueError("Invalid SHA1 Hash! Must be 40 characters!")
+
+        if " " in file_hash or " " in file_name:
+            raise ValueError("file name and hash cannot contain spaces")
+
+        if not file_name:
+            raise ValueError("No file_name specified. Must be at least one character.")
+
+        result = await self.get("upload/" + file_hash + "/" + file_name)
+        if b"Upload not found" in result.content:
+            besapi_logger.debug("WARNING: Upload not found!")
+            return None
+
+        return result
+
+    async def upload(self, file_path, file_name=None, file_hash=None):
+        """
+        Upload a single file.
+
+        https://developer.bigfix.com/rest-api/api/upload.html
+        """
+        if not os.access(file_path, os.R_OK):
+            besapi_logger.error("%s is not readable", file_path)
+            raise FileNotFoundError
+
+        # if file_name not specified, then get it from tail of file_path
+        if not file_name:
+            file_name = os.path.basename(file_path)
+
+        # files cannot contain spaces:
+        file_name = file_name.replace(" ", "_")
+
+        if not file_hash:
+            file_hash = await asyncio.to_thread(besapi.besapi.get_file_sha1, file_path)
+
+        check_upload = await self.get_upload(file_name, file_hash)
+        if check_upload:
+            besapi_logger.warning("Existing Matching Upload Found, Skipping Upload!")
+            return check_upload
+
+        headers = {"Content-Disposition": f'attachment; filename="{file_name}"'}
+        besapi_logger.warning(
+            "Uploading `%s` to BigFix Server, this could take a while.", file_name
+        )
+        with open(file_path, "rb") as f:
+            return await self.post("upload", data=f, headers=headers)
+
+    async def get_content_by_resource(self, resource_url):
+        """Get a single content item by resource."""
+        try:
+            return await self.get(resource_url.replace("http://", "https://"))
+        except PermissionError as err:
+            besapi_logger.error("Could not export item:")
+            besapi_logger.error(err)
+        return None
+
+    async def export_item_by_resource(
+        self, content_resource, export_folder="./", **kwargs
+    ):
+        """Export a single item by resource.
+
+        See BESConnection.export_item_by_resource for the options.
+        """
+        content = await self.get_content_by_resource(content_resource)
+        if not content:
+            besapi_logger.warning("Content not found")
+            return None
+
+        # don't block the event loop writing the file:
+        return await asyncio.to_thread(
+            besapi.besapi.export_item_content,
+            content,
+            content_resource,
+            export_folder,
+            **kwargs,
+        )
+
+    async def export_site_contents(
+        self,
+        site_path,
+        export_folder="./",
+        name_trim=100,
+        verbose=False,
+        include_site_folder=True,
+        include_item_ids=True,
+        max_concurrent=10,
+    ):
+        """Export contents of site, getting up to max_concurrent items at once.
+
+        See BESConnection.export_site_contents for the options, returns the
+        file paths of the exported items.
+        """
+        content = await self.get("site/" + site_path + "/content")
+        if verbose:
+            print(content)
+        if content.status_code != 200:
+            return []
+
+        items = list(content().iterchildren())
+        print("Archiving %d items from %s..." % (len(items), site_path))
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def export_item(item):
+            if verbose:
+                print(
+                    "{%s} (%s) [%s] %s - %s    "
+                    % (
+                        site_path,
+                        item.tag,
+                        item.ID,
+                        item.Name.text,
+                        item.attrib["LastModified"],
+                    )
+                )
+            async with semaphore:
+                item_content = await self.get_content_by_resource(
+                    item.attrib["Resource"]
+                )
+            if not item_content:
+                return None
+
+            return await asyncio.to_thread(
+                besapi.besapi.export_site_item_content,
+                item_content,
+                item,
+                site_path,
+                export_folder,
+                name_trim,
+                include_site_folder,
+                include_item_ids,
+            )
+
+        item_paths = await asyncio.gather(*(export_item(item) for item in items))
+        return [item_path for item_path in item_paths if item_path]
+
+    async def export_all_sites(
+        self,
+        include_external=False,
+        export_folder="./",
+        name_trim=70,
+        verbose=False,
+        max_concurrent=10,
+    ):
+        """Export all bigfix sites to a folder, one site at a time."""
+        results_sites = await self.get("sites")
+        if verbose:
+            print(results_sites)
+        item_paths = []
+        if results_sites.status_code == 200:
+            for item in results_sites().iterchildren():
+                site_path = item.attrib["Resource"].split("/api/site/", 1)[1]
+                if include_external or "external/" not in site_path:
+                    print("Exporting Site:", site_path)
+                    item_paths.extend(
+                        await self.export_site_contents(
+                            site_path,
+                            export_folder,
+                            name_trim,
+                            verbose,
+                            max_concurrent=max_concurrent,
+                        )
+                    )
+        return item_paths
+
+
+def get_async_bes_conn_using_config_file(conf_file=None, **kwargs):
+    """
+    Read connection values from config file.
+
+    return AsyncBESConnection, use it with `async with`
+    """
+    bes_conn_config = besapi.besapi.get_bes_conn_config(conf_file)
+    if bes_conn_config:
+        # requests are not retried by the async connection:
+        bes_conn_config.pop("retries", None)
+        return AsyncBESConnection(**{**bes_conn_config, **kwargs})
+
+    return None
@@ -4,12 +4,18 @@ see example here: https://github.com/jgstew/besapi/blob/master/examples/export_a
 """
 
 import argparse
+import atexit
+import base64
+import datetime
 import getpass
+import hashlib
+import json
 import logging
 import logging.handlers
 import ntpath
 import os
 import sys
+import time
 from typing import Union
 
 import besapi
@@ -17,6 +23,20 @@ import besapi
 if os.name == "nt":
     import besapi.plugin_utilities_win
 
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = ValueError
+
+# seconds a cached session is used for, it is refreshed on 401 before that:
+SESSION_CACHE_MAX_AGE = 30 * 60
+
+SESSION_CACHE_PBKDF2_ITERATIONS = 200000
+
+# session cache path: (bes_conn, password, folder, data when loaded or saved)
+_session_cache_pending: dict = {}
+
 
 # NOTE: This does not work as expected when run from plugin_utilities
 def get_invoke_folder(verbose=0):
@@ -144,6 +164,242 @@ def get_plugin_logging_config(log_file_path="", verbose=0, console=True):
     }
 
 
+def get_session_cache_folder():
+    """Get the default folder for the session cache."""
+    return os.path.join(os.path.expanduser("~"), ".besapi", "sessions")
+
+
+def get_session_cache_path(rootserver, username, folder=None):
+    """Get the session cache file path for a root server and user."""
+    key = hashlib.sha256(f"{rootserver}\n{username}".encode("utf-8")).hexdigest()
+    return os.path.join(folder or get_session_cache_folder(), key + ".session")
+
+
+def get_session_cache_fernet(password: str, salt: bytes):
+    """Get a Fernet with a key derived from the password and salt."""
+    key = hashlib.pbkdf2_hmac(
+        "sha256", password.encode("utf-8"), salt, SESSION_CACHE_PBKDF2_ITERATIONS
+    )
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def session_cache_encrypt(plaintext: str, password: str) -> Union[dict, None]:
+    """Encrypt session cache data.
+
+    Uses DPAPI on Windows, otherwise the optional cryptography package with a
+    key derived from the password. Returns None if neither is available.
+    """
+    if os.name == "nt":
+        return {
+            "method": "dpapi",
+            # scope 0 is the current user rather than the machine:
+            "data": besapi.plugin_utilities_win.win_dpapi_encrypt_str(
+                plaintext, scope_flags=0
+            ),
+        }
+
+    if Fernet is None:
+        logging.warning(
+            "Session cache disabled, requires the cryptography package: pip install cryptography"
+        )
+        return None
+
+    salt = os.urandom(16)
+    return {
+        "method": "fernet",
+        "salt": base64.b64encode(salt).decode("utf-8"),
+        "data": get_session_cache_fernet(password, salt)
+        .encrypt(plaintext.encode("utf-8"))
+        .decode("utf-8"),
+    }
+
+
+def session_cache_decrypt(encrypted: dict, password: str) -> Union[str, None]:
+    """Decrypt session cache data from session_cache_encrypt, None on failure."""
+    try:
+        if encrypted.get("method") == "dpapi" and os.name == "nt":
+            return besapi.plugin_utilities_win.win_dpapi_decrypt_base64(
+                encrypted["data"], scope_flags=0
+            )
+
+        if encrypted.get("method") == "fernet" and Fernet is not None:
+            salt = base64.b64decode(encrypted["salt"])
+            return (
+                get_session_cache_fernet(password, salt)
+                .decrypt(encrypted["data"].encode("utf-8"))
+                .decode("utf-8")
+            )
+    except (InvalidToken, KeyError, ValueError) as err:
+        logging.warning("Could not decrypt session cache: %s", err)
+
+    return None
+
+
+def get_session_cache_data(bes_conn):
+    """Get the cookies and operator info of a connection for the session cache."""
+    return {
+        "rootserver": bes_conn.rootserver,
+        "username": bes_conn.username,
+        "is_main_operator": bes_conn.is_main_operator,
+        "cookies": [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "expires": cookie.expires,
+            }
+            for cookie in bes_conn.session.cookies
+        ],
+    }
+
+
+def save_session_cache(bes_conn, password, folder=None):
+    """Save the cookies and operator info of a connection to the session cache.
+
+    Returns the file path, or None if the cache could not be encrypted.
+    """
+    if not bes_conn.last_connected:
+        return None
+
+    session_data = get_session_cache_data(bes_conn)
+    session_data["saved"] = time.time()
+    encrypted = session_cache_encrypt(json.dumps(session_data), password)
+    if encrypted is None:
+        return None
+
+    file_path = get_session_cache_path(bes_conn.rootserver, bes_conn.username, folder)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # only readable by the current user:
+    with os.fdopen(
+        os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+        "w",
+        encoding="utf-8",
+    ) as cache_file:
+        json.dump(encrypted, cache_file)
+
+    logging.debug("Saved session cache: %s", file_path)
+    return file_path
+
+
+def clear_session_cache(bes_conn, folder=None):
+    """Remove the session cache file for a connection, if there is one."""
+    file_path = get_session_cache_path(bes_conn.rootserver, bes_conn.username, folder)
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+
+
+def load_session_cache(bes_conn, password, folder=None, max_age=SESSION_CACHE_MAX_AGE):
+    """Load cookies and operator info from the session cache into a connection.
+
+    The cache is only used if it is for the same root server and user and is
+    newer than max_age seconds. Returns True if it was loaded.
+    """
+    file_path = get_session_cache_path(bes_conn.rootserver, bes_conn.username, folder)
+    if not os.path.isfile(file_path):
+        return False
+
+    try:
+        with open(file_path, encoding="utf-8") as cache_file:
+            plaintext = session_cache_decrypt(json.load(cache_file), password)
+        if plaintext is None:
+            raise ValueError("could not decrypt it")
+        session_data = json.loads(plaintext)
+        cookies = [dict(cookie) for cookie in session_data["cookies"]]
+        valid = (
+            session_data.get("rootserver") == bes_conn.rootserver
+            and session_data.get("username") == bes_conn.username
+            and time.time() - session_data.get("saved", 0) <= max_age
+        )
+    except (AttributeError, KeyError, TypeError, ValueError) as err:
+        logging.warning("Session cache is not valid: %s", err)
+        valid = False
+
+    if not valid:
+        logging.info("Session cache not used, it is invalid or too old.")
+        os.remove(file_path)
+        return False
+
+    for cookie in cookies:
+        bes_conn.session.cookies.set(**cookie)
+    bes_conn.is_main_operator = session_data.get("is_main_operator")
+    bes_conn.last_connected = datetime.datetime.now()
+    # login is not requested again, a stale session is refreshed on 401 by
+    # get_session_cache_refresh_hook:
+    bes_conn.authenticated = True
+    logging.info("Using session cache: %s", file_path)
+    return True
+
+
+def get_session_cache_refresh_hook(bes_conn, folder=None):
+    """Get a requests response hook that drops the cached session on 401.
+
+    The request is sent again without the cached cookies, so the credentials
+    are used to login again.
+    """
+
+    def refresh_on_unauthorized(response, **kwargs):
+        if response.status_code != 401 or "Cookie" not in response.request.headers:
+            return response
+
+        logging.info("Cached session was rejected, logging in again.")
+        bes_conn.session.cookies.clear()
+        clear_session_cache(bes_conn, folder)
+        request = response.request.copy()
+        del request.headers["Cookie"]
+        return bes_conn.session.send(request, **kwargs)
+
+    return refresh_on_unauthorized
+
+
+def save_pending_session_caches():
+    """Save the session caches that changed since get_besapi_connection_cached.
+
+    This is registered to run when the process exits.
+    """
+    while _session_cache_pending:
+        _, (bes_conn, password, folder, cached_data) = _session_cache_pending.popitem()
+        if get_session_cache_data(bes_conn) != cached_data:
+            save_session_cache(bes_conn, password, folder)
+
+
+def get_besapi_connection_cached(username, password, rootserver, session_cache=True):
+    """Get connection to besapi, reusing the session cache from a previous run.
+
+    session_cache is True for the default folder, or the folder to use.
+    The session is saved after a fresh login, and again when the process
+    exits if the cookies or operator info changed during this run. Only the
+    last connection for each cache path is saved at exit. Each save or load
+    derives the key again, which is slow on purpose.
+    """
+    folder = None if session_cache is True else session_cache
+    bes_conn = besapi.besapi.BESConnection(
+        username, password, rootserver, lazy_login=True
+    )
+    bes_conn.session.hooks["response"].append(
+        get_session_cache_refresh_hook(bes_conn, folder)
+    )
+
+    if not load_session_cache(bes_conn, password, folder):
+        bes_conn.login()
+        if not save_session_cache(bes_conn, password, folder):
+            return bes_conn
+
+    file_path = get_session_cache_path(rootserver, username, folder)
+    _session_cache_pending[file_path] = (
+        bes_conn,
+        password,
+        folder,
+        get_session_cache_data(bes_conn),
+    )
+    # only one handler, however many cached connections are made:
+    atexit.unregister(save_pending_session_caches)
+    atexit.register(save_pending_session_caches)
+
+    return bes_conn
+
+
 def get_besapi_connection_env_then_config():
     """Get connection to besapi using env vars first, then config file."""
     logging.info("attempting connection to BigFix using ENV method.")
@@ -159,8 +415,12 @@ def get_besapi_connection_env_then_config():
 
 def get_besapi_connection_args(
     args: argparse.Namespace,
+    session_cache: Union[bool, str] = False,
 ) -> Union[besapi.besapi.BESConnection, None]:
-    """Get connection to besapi using provided args."""
+    """Get connection to besapi using provided args.
+
+    See get_besapi_connection for session_cache.
+    """
     password = None
     bes_conn = None
 
@@ -195,7 +455,12 @@ def get_besapi_connection_args(
         try:
             if not rest_url:
                 raise AttributeError("args.rest_url is not set.")
-            bes_conn = besapi.besapi.BESConnection(args.user, password, rest_url)
+            if session_cache:
+                bes_conn = get_besapi_connection_cached(
+                    args.user, password, rest_url, session_cache
+                )
+            else:
+                bes_conn = besapi.besapi.BESConnection(args.user, password, rest_url)
         except (
             AttributeError,
             ConnectionRefusedError,
@@ -238,6 +503,7 @@ def get_besapi_connection_args(
 
 def get_besapi_connection(
     args: Union[argparse.Namespace, None] = None,
+    session_cache: Union[bool, str] = False,
 ) -> Union[besapi.besapi.BESConnection, None]:
     """Get connection to besapi.
 
@@ -248,6 +514,10 @@ def get_besapi_connection(
 
     Arguments:
         args: argparse.Namespace object, usually from setup_plugin_argparse()
+        session_cache: reuse the login session from the previous run for the
+            args user, True for the default folder or the folder to use.
+            The cache is encrypted with DPAPI on Windows, otherwise it
+            requires the cryptography package: pip install besapi[session_cache]
     Returns:
         A BESConnection object if successful, otherwise None.
     """
@@ -264,7 +534,7 @@ def get_besapi_connection(
 
     # attempt bigfix connection with provided args:
     if args.user:
-        bes_conn = get_besapi_connection_args(args)
+        bes_conn = get_besapi_connection_args(args, session_cache)
     else:
         logging.info(
             "no user arg provided, attempting connection using env then config."
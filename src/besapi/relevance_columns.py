@@ -0,0 +1,236 @@
+"""Columnar, typed storage for session relevance tuple results.
+
+Session relevance returns tuples as lists of lists of python objects, which
+takes a lot of memory for large reports and is slow to aggregate row by row.
+ColumnarResult stores each tuple item in its own typed column instead:
+
+- int, float and bool columns are backed by compact `array.array` storage
+- str columns are lists of interned strings, so repeated values are shared
+- time columns parse BigFix times and store them as epoch seconds
+
+Example:
+    result = bes_conn.session_relevance_columns(
+        "(id of it, name of it, last report time of it) of bes computers",
+        [("id", "int"), ("name", "str"), ("last_report", "time")],
+    )
+    recent = result.filter("last_report", lambda ts: ts > time.time() - 86400)
+    print(recent.group_count("name"))
+"""
+
+import array
+import collections
+import datetime
+import itertools
+import sys
+
+# same format as besapi.parse_bes_modtime, like `Tue, 14 Oct 2025 16:05:30 +0000`
+BES_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
+
+# array typecodes for the column types that are not stored as lists:
+COLUMN_TYPECODES = {"int": "q", "float": "d", "bool": "b", "time": "d"}
+
+COLUMN_TYPES = ("int", "float", "bool", "str", "time")
+
+
+def parse_bes_time(value):
+    """Parse a BigFix time string to epoch seconds."""
+    return datetime.datetime.strptime(value, BES_TIME_FORMAT).timestamp()
+
+
+def to_bool(value):
+    """Convert a relevance boolean, which might be a string, to a bool."""
+    if isinstance(value, str):
+        if value.lower() not in ("true", "false"):
+            raise ValueError(f"Not a relevance boolean: `{value}`")
+        return value.lower() == "true"
+    return bool(value)
+
+
+class Column:
+    """A single typed column of relevance results."""
+
+    __slots__ = ("name", "kind", "data", "_convert")
+
+    def __init__(self, name, kind="str", data=None):
+        if kind not in COLUMN_TYPES:
+            raise ValueError(
+                f"Column type must be one of {COLUMN_TYPES}, got `{kind}` for `{name}`"
+            )
+        self.name = name
+        self.kind = kind
+        self._convert = {
+            "int": int,
+            "float": float,
+            "bool": to_bool,
+            "str": lambda value: sys.intern(str(value)),
+            "time": parse_bes_time,
+        }[kind]
+
+        if kind == "str":
+            self.data = [] if data is None else list(data)
+        else:
+            self.data = array.array(COLUMN_TYPECODES[kind], data or ())
+
+    def convert(self, value):
+        """Convert a value to the type stored in this column."""
+        return self._convert(value)
+
+    def append(self, value):
+        """Convert and append a value to this column."""
+        self.data.append(self._convert(value))
+
+    def take(self, indexes):
+        """Get a new column with only the values at indexes."""
+        data = self.data
+        return Column(self.name, self.kind, (data[index] for index in indexes))
+
+    def compress(self, selectors):
+        """Get a new column with only the values where selectors is true."""
+        return Column(self.name, self.kind, itertools.compress(self.data, selectors))
+
+    def value(self, stored):
+        """Get the python value for a stored value."""
+        if self.kind == "bool":
+            return bool(stored)
+        if self.kind == "time":
+            return datetime.datetime.fromtimestamp(stored, datetime.timezone.utc)
+        return stored
+
+    def values(self):
+        """Iterate the python values of this column."""
+        if self.kind in ("bool", "time"):
+            return map(self.value, self.data)
+        return iter(self.data)
+
+    def __getitem__(self, index):
+        return self.value(self.data[index])
+
+    def __iter__(self):
+        return self.values()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"Column({self.name!r}, {self.kind!r}, {len(self)} values)"
+
+
+class ColumnarResult:
+    """Relevance tuple results stored as typed columns.
+
+    columns is a list of (name, type) tuples, in the same order as the
+    items of the relevance tuple. Types are: int, float, bool, str, time
+    """
+
+    def __init__(self, columns):
+        self.columns = {}
+        for name, kind in columns:
+            if name in self.columns:
+                raise ValueError(f"Duplicate column name: `{name}`")
+            self.columns[name] = Column(name, kind)
+
+    @classmethod
+    def from_rows(cls, rows, columns):
+        """Build a columnar result from an iterable of relevance result rows."""
+        result = cls(columns)
+        result.extend(rows)
+        return result
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a columnar result from existing Column objects."""
+        result = cls(())
+        result.columns = {column.name: column for column in columns}
+        return result
+
+    @property
+    def names(self):
+        """Get the column names in order."""
+        return list(self.columns)
+
+    def append(self, row):
+        """Append one relevance result row."""
+        # a single column query returns plain values instead of lists:
+        if not isinstance(row, (list, tuple)):
+            row = (row,)
+        if len(row) != len(self.columns):
+            raise ValueError(
+                f"Row has {len(row)} items but there are {len(self.columns)} columns: {row}"
+            )
+        columns = list(self.columns.values())
+        # convert the whole row first, so a bad value can't misalign the columns:
+        values = [column.convert(value) for column, value in zip(columns, row)]
+        for index, (column, value) in enumerate(zip(columns, values)):
+            try:
+                column.data.append(value)
+            except OverflowError:
+                # like an int too large for the array, undo the rest of the row:
+                for appended in columns[:index]:
+                    appended.data.pop()
+                raise
+
+    def extend(self, rows):
+        """Append many relevance result rows."""
+        for row in rows:
+            self.append(row)
+
+    def row(self, index):
+        """Get a single row as a tuple of python values."""
+        return tuple(column[index] for column in self.columns.values())
+
+    def rows(self):
+        """Iterate rows as tuples of python values."""
+        return zip(*(column.values() for column in self.columns.values()))
+
+    def to_dicts(self):
+        """Get the rows as a list of dicts keyed by column name."""
+        names = self.names
+        return [dict(zip(names, row)) for row in self.rows()]
+
+    def filter(self, name, predicate):
+        """Get a new result with only the rows where predicate(value) is true.
+
+        The predicate gets values as stored so comparisons stay cheap: epoch
+        seconds rather than a datetime for time columns, 0 or 1 for bool.
+        """
+        selectors = [bool(predicate(value)) for value in self.columns[name].data]
+        return ColumnarResult.from_columns(
+            column.compress(selectors) for column in self.columns.values()
+        )
+
+    def take(self, indexes):
+        """Get a new result with only the rows at indexes."""
+        indexes = list(indexes)
+        return ColumnarResult.from_columns(
+            column.take(indexes) for column in self.columns.values()
+        )
+
+    def group_count(self, name):
+        """Count the rows for each value of a column."""
+        return collections.Counter(self.columns[name].values())
+
+    def group_by(self, key, value, aggregate=sum):
+        """Aggregate the values of one column grouped by another column.
+
+        Returns a dict of key column value to aggregate(list of values).
+        Values are passed as stored, so bool columns are 0 or 1 and time
+        columns are epoch seconds.
+        """
+        groups = collections.defaultdict(list)
+        for group, item in zip(self.columns[key].values(), self.columns[value].data):
+            groups[group].append(item)
+        return {group: aggregate(items) for group, items in groups.items()}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __repr__(self):
+        columns = ", ".join(
+            f"{column.name}:{column.kind}" for column in self.columns.values()
+        )
+        return f"ColumnarResult({columns}; {len(self)} rows)"
@@ -0,0 +1,147 @@
+"""Incremental session relevance queries that only get what changed.
+
+The relevance must contain `{since}`, which is replaced with the time of the
+newest row from the previous run, for example:
+
+    (id of it, name of it, last report time of it) of bes computers
+    whose(last report time of it > {since})
+
+The rows are merged by a key column into the previous result, and the result
+and watermark are saved to a json state file between runs. Rows that no
+longer exist on the server are not removed, run with a fresh state file now
+and then to catch deletions.
+
+Example:
+    query = besapi.relevance_incremental.IncrementalRelevance(
+        relevance, "computers_state.json", key_index=0, time_index=2
+    )
+    changed_rows = query.run(bes_conn)
+    all_rows = query.rows
+"""
+
+import datetime
+import json
+import logging
+import os
+
+import besapi
+
+besapi_logger = logging.getLogger("besapi")
+
+# used for {since} on the first run, when there is no watermark yet:
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_relevance_time(value):
+    """Get a relevance time literal for a datetime."""
+    return f'("{value.strftime(besapi.relevance_columns.BES_TIME_FORMAT)}" as time)'
+
+
+class IncrementalRelevance:
+    """A session relevance query that is merged into a locally stored result.
+
+    key_index is the tuple item that identifies each row, like the computer
+    id, and time_index is the tuple item with the time each row changed,
+    like the last report time. overlap is the number of seconds before the
+    watermark to query again, so rows changed while the previous query was
+    running are not missed.
+    """
+
+    def __init__(self, relevance, state_file, key_index=0, time_index=-1, overlap=60):
+        if "{since}" not in relevance:
+            raise ValueError("relevance must contain `{since}` for the watermark")
+        self.relevance = relevance
+        self.state_file = state_file
+        self.key_index = key_index
+        self.time_index = time_index
+        self.overlap = overlap
+        self.watermark = None
+        self._rows = {}
+        self.load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __repr__(self):
+        return f"Object: besapi.IncrementalRelevance( state_file={self.state_file}, rows={len(self)}, watermark={self.watermark} )"
+
+    @property
+    def rows(self):
+        """Get all rows of the merged result."""
+        return list(self._rows.values())
+
+    def load(self):
+        """Load the watermark and rows from the state file, if it exists."""
+        if not os.path.isfile(self.state_file):
+            return
+
+        with open(self.state_file, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+
+        if state.get("relevance") != self.relevance:
+            besapi_logger.info(
+                "Relevance changed, not using previous state in %s", self.state_file
+            )
+            return
+
+        if state.get("watermark"):
+            self.watermark = besapi.besapi.parse_bes_modtime(state["watermark"])
+        self._rows = {str(row[self.key_index]): row for row in state.get("rows", [])}
+
+    def save(self):
+        """Save the watermark and rows to the state file."""
+        state = {
+            "relevance": self.relevance,
+            "watermark": (
+                self.watermark.strftime(besapi.relevance_columns.BES_TIME_FORMAT)
+                if self.watermark
+                else None
+            ),
+            "rows": self.rows,
+        }
+        # write to a temp file first so a failure never leaves a partial state:
+        temp_file_path = self.state_file + ".tmp"
+        with open(temp_file_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_file_path, self.state_file)
+
+    def reset(self):
+        """Forget the watermark and rows, so the next run gets everything."""
+        self.watermark = None
+        self._rows = {}
+
+    def get_relevance(self):
+        """Get the relevance to run, with {since} replaced by the watermark."""
+        since = EPOCH
+        if self.watermark is not None:
+            since = self.watermark - datetime.timedelta(seconds=self.overlap)
+        return self.relevance.replace("{since}", get_relevance_time(since))
+
+    def merge(self, rows):
+        """Merge new or changed rows and move the watermark forward."""
+        for row in rows:
+            self._rows[str(row[self.key_index])] = row
+            row_time = besapi.besapi.parse_bes_modtime(row[self.time_index])
+            if self.watermark is None or row_time > self.watermark:
+                self.watermark = row_time
+
+    def run(self, bes_conn, save=True, **kwargs):
+        """Get rows changed since the last run, merge them and save the state.
+
+        Returns the new or changed rows.
+        """
+        json_result = bes_conn.session_relevance_json(self.get_relevance(), **kwargs)
+        if "result" not in json_result:
+            raise ValueError(
+                f"Incremental query failed: {json_result.get('error')}\n - Relevance: `{self.relevance}`"
+            )
+
+        # a single changed row is a singular tuple, not a list of rows:
+        rows = besapi.besapi.get_json_result_list(json_result)
+        self.merge(rows)
+        besapi_logger.info(
+            "Incremental query got %d changed rows, %d rows total", len(rows), len(self)
+        )
+        if save:
+            self.save()
+        return rows
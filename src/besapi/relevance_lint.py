@@ -0,0 +1,216 @@
+r"""Find relevance that is known to be slow to evaluate.
+
+Fixlet relevance is evaluated over and over on every endpoint, so inspectors
+like WMI, descendant folders, event logs or hashing can burn a lot of CPU
+across thousands of fixlets. This scans relevance from strings, .bes files
+or folders of exported content for these patterns and scores them, so that
+the worst content can be found before it ships.
+
+Content with a score can be given an `x-relevance-evaluation-period` mime
+field to limit how often the relevance is evaluated, see
+examples/fixlet_add_mime_field.py
+
+Example:
+    for report in besapi.relevance_lint.analyze_folder("exported_site"):
+        if report["score"] and not report["evaluation_period"]:
+            print(report["file"], report["title"], report["suggested_period"])
+"""
+
+import logging
+import os
+import re
+
+import lxml.etree
+
+import besapi
+
+besapi_logger = logging.getLogger("besapi")
+
+EVALUATION_PERIOD_MIME_FIELD = "x-relevance-evaluation-period"
+
+# (minimum score, suggested x-relevance-evaluation-period) highest first:
+EVALUATION_PERIODS = ((10, "12:00:00"), (5, "06:00:00"), (1, "01:00:00"))
+
+# (name, regex, weight, suggestion) for each slow relevance pattern:
+SLOW_PATTERNS = (
+    (
+        "wmi",
+        r"\bwmis?\b",
+        5,
+        "WMI queries are slow, store the answer in a client setting on a schedule instead",
+    ),
+    (
+        "descendants",
+        r"\bdescendants?\b",
+        5,
+        "descendants walks whole folder trees, use specific folders instead",
+    ),
+    (
+        "event log",
+        r"\brecords? of[a-z0-9 ]* event logs?\b",
+        5,
+        "reading event logs is slow, filter with a specific event log and record range",
+    ),
+    (
+        "log lines",
+        # lines of the same file, not across `;`, `and` or `or` but skipping
+        # over string literals in between:
+        r'\blines?\b(?:(?!\b(?:and|or)\b)[^;"]|"[^"]*")*?\bof +files? +(?:%22|")[^"]*?\.log(?:%22|")',
+        4,
+        "scanning the lines of log files is slow, use `line containing` or a smaller file",
+    ),
+    (
+        "hashing",
+        r"\b(?:md5|sha1|sha2?_?\d{3,4})s? +of +",
+        4,
+        "hashing reads the whole file, compare size and modification time first",
+    ),
+    (
+        "scheduled tasks",
+        r"\bof scheduled tasks?\b",
+        4,
+        "enumerating scheduled tasks is slow, look up a task by name instead",
+    ),
+    (
+        "image files of processes",
+        r"\bimage files? of processe?s?\b",
+        3,
+        "getting image files of all processes is slow, filter processes by name first",
+    ),
+    (
+        "active directory",
+        r"\bof active director",
+        3,
+        "active directory queries go over the network, store the answer in a client setting",
+    ),
+    (
+        "folders of folders",
+        r"\bfolders? of folders?\b",
+        3,
+        "nested folder enumeration is slow, use specific folder paths",
+    ),
+    (
+        "maximum modification time",
+        r"\bmaxim(?:um|a) of modification times?\b",
+        3,
+        "getting the maximum modification time reads every file, narrow the files first",
+    ),
+    (
+        "active device",
+        r"\bof active devices?\b",
+        2,
+        "enumerating active devices is slow, filter on a specific device class",
+    ),
+    (
+        "smbios",
+        r"\bof smbios\b",
+        2,
+        "smbios enumeration is slow, use the computer or bios inspectors if possible",
+    ),
+    (
+        "path variable",
+        r"\bsubstrings separated by \(?(?:%22|\")[;:]",
+        2,
+        "splitting environment variables is slow, check for a specific value instead",
+    ),
+    (
+        "packages",
+        r"\b(?:rpm|debianpackages?|debian packages?|winrt packages?)\b",
+        2,
+        "enumerating packages is slow, look up a package by name instead",
+    ),
+)
+
+slow_patterns = tuple(
+    (name, re.compile(regex, re.IGNORECASE), weight, suggestion)
+    for name, regex, weight, suggestion in SLOW_PATTERNS
+)
+
+
+def analyze_relevance(relevance):
+    """Get a list of the slow patterns found in a relevance string.
+
+    Each finding is a dict of: pattern, count, weight, score, suggestion
+    """
+    findings = []
+    for name, regex, weight, suggestion in slow_patterns:
+        count = len(regex.findall(relevance))
+        if count:
+            findings.append(
+                {
+                    "pattern": name,
+                    "count": count,
+                    "weight": weight,
+                    "score": weight * count,
+                    "suggestion": suggestion,
+                }
+            )
+    return findings
+
+
+def score_relevance(relevance):
+    """Get the total slow pattern score of a relevance string."""
+    return sum(finding["score"] for finding in analyze_relevance(relevance))
+
+
+def suggest_evaluation_period(score):
+    """Get the suggested x-relevance-evaluation-period for a score, or None."""
+    for minimum_score, evaluation_period in EVALUATION_PERIODS:
+        if score >= minimum_score:
+            return evaluation_period
+    return None
+
+
+def analyze_content_element(content):
+    """Analyze the relevance of a Fixlet, Task, Analysis or Baseline element."""
+    relevances = [elem.text or "" for elem in content.iter("Relevance")]
+    findings = analyze_relevance("\n".join(relevances))
+    score = sum(finding["score"] for finding in findings)
+
+    evaluation_period = None
+    for mime_field in content.iterfind("MIMEField"):
+        if mime_field.findtext("Name", "").lower() == EVALUATION_PERIOD_MIME_FIELD:
+            evaluation_period = mime_field.findtext("Value")
+
+    return {
+        "type": content.tag,
+        "title": content.findtext("Title"),
+        "score": score,
+        "findings": findings,
+        "evaluation_period": evaluation_period,
+        "suggested_period": suggest_evaluation_period(score),
+    }
+
+
+def analyze_bes_file(file_path):
+    """Analyze the relevance of each item in a .bes file.
+
+    Returns a list with a report dict for each Fixlet, Task, Analysis or
+    Baseline in the file, see analyze_content_element.
+    """
+    tree = lxml.etree.parse(file_path, besapi.besapi.get_xml_parser())
+    reports = []
+    for content in tree.getroot().iterchildren(lxml.etree.Element):
+        report = analyze_content_element(content)
+        report["file"] = file_path
+        reports.append(report)
+    return reports
+
+
+def analyze_folder(folder_path, extension=".bes"):
+    """Analyze every .bes file in a folder, like an exported site.
+
+    Reports are yielded for each item, see analyze_bes_file. Files that
+    can not be parsed are logged and skipped.
+    """
+    for root, dirs, files in os.walk(folder_path):
+        # walk in a consistent order:
+        dirs.sort()
+        for file_name in sorted(files):
+            if not file_name.lower().endswith(extension):
+                continue
+            file_path = os.path.join(root, file_name)
+            try:
+                yield from analyze_bes_file(file_path)
+            except lxml.etree.XMLSyntaxError as err:
+                besapi_logger.warning("Skipping `%s` not valid XML: %s", file_path, err)
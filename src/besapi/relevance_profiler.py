@@ -0,0 +1,207 @@
+"""Profile session relevance queries to compare how expensive they are.
+
+Each relevance expression is run a number of times, recording for every run:
+
+- evaltime_ms: the evaluation time reported by the server
+- round_trip_ms: the time the client waited for the complete response
+- payload_bytes: the size of the response body
+- result_count: the number of results returned
+
+The report has min, mean, percentiles and max of each of these, and can be
+saved as json or printed as a table.
+
+Example:
+    report = besapi.relevance_profiler.profile_relevances(
+        bes_conn, ["number of bes computers", "names of bes computers"], 5
+    )
+    print(besapi.relevance_profiler.report_table(report))
+"""
+
+import datetime
+import json
+import logging
+import time
+import urllib.parse
+
+import besapi
+
+besapi_logger = logging.getLogger("besapi")
+
+PERCENTILES = (50, 90, 95, 99)
+
+METRICS = ("evaltime_ms", "round_trip_ms", "payload_bytes", "result_count")
+
+
+def percentile(values, percent):
+    """Get a percentile of values, interpolating between the closest ranks."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(values):
+    """Get min, mean, percentiles and max for a list of numbers."""
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+
+    summary = {"min": min(values), "mean": sum(values) / len(values)}
+    for percent in PERCENTILES:
+        summary[f"p{percent}"] = percentile(values, percent)
+    summary["max"] = max(values)
+    return summary
+
+
+def run_relevance(bes_conn, relevance, **kwargs):
+    """Run a session relevance query once and measure it.
+
+    This goes straight to the server, so a relevance cache on the connection
+    does not affect the timing.
+    """
+    rel_data = {
+        "output": "json",
+        "relevance": urllib.parse.quote(relevance, safe=":+"),
+    }
+    sample = {metric: None for metric in METRICS}
+    sample["error"] = None
+
+    start_time = time.perf_counter()
+    response = bes_conn.session.post(
+        bes_conn.url("query"), data=rel_data, verify=bes_conn.verify, **kwargs
+    )
+    content = response.content
+    sample["round_trip_ms"] = (time.perf_counter() - start_time) * 1000
+    sample["payload_bytes"] = len(content)
+
+    try:
+        json_result = json.loads(content)
+    except ValueError:
+        sample["error"] = f"HTTP {response.status_code}: {response.text[:200]}"
+        return sample
+
+    if "evaltime_ms" in json_result:
+        sample["evaltime_ms"] = float(json_result["evaltime_ms"])
+
+    if "result" in json_result:
+        sample["result_count"] = len(besapi.besapi.get_json_result_list(json_result))
+    else:
+        sample["error"] = json_result.get("error", "Unknown error")
+
+    return sample
+
+
+def profile_relevance(bes_conn, relevance, iterations=5, warmup=1, delay=0.0, **kwargs):
+    """Run a session relevance query many times and summarize the timing.
+
+    warmup runs are done first and not counted, and delay is the number of
+    seconds to wait between runs.
+    """
+    samples = []
+    for i in range(warmup + iterations):
+        if i and delay:
+            time.sleep(delay)
+        sample = run_relevance(bes_conn, relevance, **kwargs)
+        if i >= warmup:
+            samples.append(sample)
+
+    profile = {
+        "relevance": relevance,
+        "iterations": iterations,
+        "errors": [sample["error"] for sample in samples if sample["error"]],
+    }
+    for metric in METRICS:
+        profile[metric] = summarize(sample[metric] for sample in samples)
+    profile["samples"] = samples
+
+    besapi_logger.info(
+        "Profiled %d runs of relevance: %s", iterations, string_truncate(relevance)
+    )
+    return profile
+
+
+def profile_relevances(
+    bes_conn, relevances, iterations=5, warmup=1, delay=0.0, **kwargs
+):
+    """Profile each of many session relevance queries and get a report."""
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "rootserver": bes_conn.rootserver,
+        "iterations": iterations,
+        "warmup": warmup,
+        "profiles": [
+            profile_relevance(bes_conn, relevance, iterations, warmup, delay, **kwargs)
+            for relevance in relevances
+        ],
+    }
+
+
+def report_json(report, file_path=None, indent=2):
+    """Get the report as json, and save it to file_path if provided."""
+    report_text = json.dumps(report, indent=indent)
+    if file_path:
+        with open(file_path, "w", encoding="utf-8") as report_file:
+            report_file.write(report_text)
+    return report_text
+
+
+def string_truncate(text, max_length=70):
+    """Truncate a string to a maximum length and append ellipsis if truncated."""
+    if len(text) > max_length:
+        return text[:max_length] + "..."
+    return text
+
+
+def format_number(value):
+    """Format a number for the report table."""
+    if value is None:
+        return "-"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:0.2f}"
+    return f"{int(value)}"
+
+
+def profile_stat(profile, metric, name):
+    """Get one formatted summary value of a profile, like the p95 evaltime."""
+    return format_number((profile[metric] or {}).get(name))
+
+
+def report_table(report, max_length=50):
+    """Get the report as a plain text table, one row per relevance."""
+    header = (
+        "Relevance",
+        "Results",
+        "Bytes",
+        "Eval p50",
+        "Eval p95",
+        "RTT p50",
+        "RTT p95",
+        "Errors",
+    )
+    rows = [header]
+    for profile in report["profiles"]:
+        rows.append(
+            (
+                string_truncate(profile["relevance"], max_length),
+                profile_stat(profile, "result_count", "max"),
+                profile_stat(profile, "payload_bytes", "p50"),
+                profile_stat(profile, "evaltime_ms", "p50"),
+                profile_stat(profile, "evaltime_ms", "p95"),
+                profile_stat(profile, "round_trip_ms", "p50"),
+                profile_stat(profile, "round_trip_ms", "p95"),
+                str(len(profile["errors"])),
+            )
+        )
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    lines = []
+    for row in rows:
+        # left align the relevance, right align the numbers:
+        cells = [row[0].ljust(widths[0])]
+        cells.extend(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))
+        lines.append("  ".join(cells))
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
@@ -4,6 +4,7 @@
 This was converted from tests/tests.py which was used before this pytest was added.
 """
 
+import base64
 import json
 import os
 import random
@@ -82,6 +83,109 @@ def test_validate_xml_bes_file():
     )
 
 
+def test_schema_registry():
+    """Test that XSDs are compiled once and then reused."""
+    registry = besapi.besapi.XMLSchemaRegistry()
+    assert registry.loaded() == []
+
+    schema = registry.get("BES.xsd")
+    assert "BES.xsd" in registry
+    assert registry.get("BES.xsd") is schema
+
+    assert registry.preload() == list(besapi.besapi.BES_XSD_FILES)
+
+    with pytest.raises(KeyError):
+        registry.get("NotASchema.xsd")
+
+    registry.clear()
+    assert registry.loaded() == []
+
+
+def test_match_xsd():
+    """Test that documents are validated against the schema for their root."""
+    with open("tests/good/RelaySelectTask.bes", "rb") as bes_file:
+        assert besapi.besapi.match_xsd(bes_file.read()) == "BES.xsd"
+
+    assert (
+        besapi.besapi.match_xsd(b"<BESAPI><NotAnElement></NotAnElement></BESAPI>")
+        is None
+    )
+    assert besapi.besapi.match_xsd(b"<BESAPI></BESAPI>") == "BESAPI.xsd"
+    assert besapi.besapi.match_xsd(b"<Unknown></Unknown>") is None
+    assert besapi.besapi.match_xsd(b"not xml") is None
+
+    class AppXMLRequestResult:
+        content = b"<BESAPI></BESAPI>"
+        encoding = None
+        headers: dict = {"content-type": "application/xml"}
+
+    # validation is skipped for application/xml, so the match is lazy:
+    rest_result = besapi.besapi.RESTResult(AppXMLRequestResult())
+    assert rest_result._valid_xsd is None
+    assert rest_result.valid_xsd == "BESAPI.xsd"
+
+    rest_result = besapi.besapi.RESTResult(XMLRequestResult())
+    assert rest_result.valid is False
+    assert rest_result.valid_xsd is None
+
+
+def test_iter_xml_elements():
+    """Test incremental parsing of large listings."""
+    import io
+
+    xml_listing = (
+        b"<BESAPI>"
+        b'<Computer Resource="1"><ID>1</ID></Computer>'
+        b'<Computer Resource="2"><ID>2</ID></Computer>'
+        b"<Other />"
+        b"</BESAPI>"
+    )
+
+    results = []
+    for elem in besapi.besapi.iter_xml_elements(io.BytesIO(xml_listing)):
+        # earlier siblings have already been freed:
+        assert all(len(sibling) == 0 for sibling in elem.itersiblings(preceding=True))
+        results.append((elem.tag, elem.get("Resource"), elem.findtext("ID")))
+    assert results == [
+        ("Computer", "1", "1"),
+        ("Computer", "2", "2"),
+        ("Other", None, None),
+    ]
+
+    results = [
+        elem.text
+        for elem in besapi.besapi.iter_xml_elements(io.BytesIO(xml_listing), "ID")
+    ]
+    assert results == ["1", "2"]
+
+
+def test_get_xml_parser():
+    """Test that parsers are reused per thread and per huge tree mode."""
+    import threading
+
+    parser = besapi.besapi.get_xml_parser()
+    assert besapi.besapi.get_xml_parser("etree") is parser
+    assert besapi.besapi.get_xml_parser("result") is not parser
+
+    other_thread_parsers = []
+    other_thread = threading.Thread(
+        target=lambda: other_thread_parsers.append(besapi.besapi.get_xml_parser())
+    )
+    other_thread.start()
+    other_thread.join()
+    assert other_thread_parsers[0] is not parser
+
+    besapi.besapi.set_xml_huge_tree(True)
+    try:
+        assert besapi.besapi.get_xml_parser() is not parser
+    finally:
+        besapi.besapi.set_xml_huge_tree(False)
+    assert besapi.besapi.get_xml_parser() is parser
+
+    with pytest.raises(ValueError):
+        besapi.besapi.get_xml_parser("html")
+
+
 def test_failing_validate_site_path():
     """Test that validate_site_path raises ValueError for invalid inputs."""
 
@@ -114,6 +218,330 @@ def test_rest_result():
     assert rest_result.text == "this is just a test"
 
 
+class XMLRequestResult:
+    text = "<BESAPI><NotAnElement>Example</NotAnElement></BESAPI>"
+    headers: dict = {}
+
+
+def test_rest_result_validation_policy():
+    """Test that lazy and off validation defer work until it is needed."""
+    rest_result = besapi.besapi.RESTResult(XMLRequestResult(), "lazy")
+    assert rest_result._valid is None
+    assert rest_result.valid is False
+    assert rest_result.besobj is None
+
+    rest_result = besapi.besapi.RESTResult(XMLRequestResult(), "off")
+    assert rest_result._valid is None
+    assert rest_result.valid is True
+    assert rest_result.besobj.NotAnElement == "Example"
+
+    with pytest.raises(ValueError):
+        besapi.besapi.RESTResult(XMLRequestResult(), "sometimes")
+
+
+def test_rest_result_single_parse():
+    """Test that every xml representation comes from the same parsed tree."""
+    rest_result = besapi.besapi.RESTResult(XMLRequestResult(), "off")
+
+    assert rest_result.besobj is rest_result.besroot
+    assert rest_result.besobj is rest_result.besobj
+    assert rest_result.besxml.endswith(XMLRequestResult.text.encode("utf-8"))
+    assert rest_result.besdict == {"NotAnElement": "Example"}
+
+    rest_result = besapi.besapi.RESTResult(RequestResult(), "lazy")
+    assert rest_result.besroot is None
+    assert rest_result.besobj is None
+    assert rest_result.besdict == {"text": "this is just a test"}
+
+
+class BytesRequestResult:
+    content = "<BESAPI><NotAnElement>Ünïcödé</NotAnElement></BESAPI>".encode("utf-8")
+    encoding = None
+    headers: dict = {}
+
+
+def test_rest_result_bytes():
+    """Test that results work from bytes and only decode text when used."""
+    rest_result = besapi.besapi.RESTResult(BytesRequestResult(), "off")
+
+    assert rest_result.content is BytesRequestResult.content
+    assert rest_result._text is None
+    assert rest_result.besobj.NotAnElement == "Ünïcödé"
+    assert rest_result._text is None
+    assert "Ünïcödé" in rest_result.text
+
+
+def test_rest_result_release_body():
+    """Test that the raw body can be dropped and derived views not cached."""
+    rest_result = besapi.besapi.RESTResult(
+        BytesRequestResult(), "off", release_body=True, cache_derived=False
+    )
+    assert not hasattr(rest_result, "__dict__")
+
+    assert rest_result.besobj.NotAnElement == "Ünïcödé"
+    assert rest_result.request is None
+    assert rest_result._content is None
+    assert "Ünïcödé" in rest_result.text
+    # the body is serialized again from the tree:
+    assert rest_result.content.startswith(b"<?xml")
+    assert "Ünïcödé".encode("utf-8") in rest_result.content
+
+    assert rest_result.besdict == {"NotAnElement": "Ünïcödé"}
+    assert rest_result._besdict is None
+    assert rest_result.besjson is not None
+    assert rest_result._besjson is None
+
+    # text results are never released:
+    rest_result = besapi.besapi.RESTResult(RequestResult(), "off", True)
+    assert rest_result.release() is False
+    assert rest_result.text == "this is just a test"
+
+
+def test_export_item_content_released(tmp_path):
+    """Test exporting a result after its raw body was released."""
+
+    class TaskRequestResult:
+        content = b"<BES><Task><Title>Example Task</Title></Task></BES>"
+        encoding = None
+        headers: dict = {}
+
+    rest_result = besapi.besapi.RESTResult(
+        TaskRequestResult(), "off", release_body=True
+    )
+    assert rest_result.besroot is not None
+    assert rest_result._content is None
+
+    item_path = besapi.besapi.export_item_content(
+        rest_result, "task/custom/Example/123", str(tmp_path) + "/"
+    )
+    assert item_path.endswith("Example_Task.bes")
+    with open(item_path, "rb") as bes_file:
+        assert b"<Title>Example Task</Title>" in bes_file.read()
+
+
+def test_elem2dict():
+    """Test converting xml to a dict with and without attributes."""
+    import lxml.etree
+
+    xml_root = lxml.etree.fromstring(
+        b'<BESAPI><Query Resource="example"><Result>'
+        b'<Answer type="integer">1</Answer><Answer type="integer">2</Answer>'
+        b"</Result><!-- comment --><Empty /></Query></BESAPI>"
+    )
+
+    assert besapi.besapi.elem2dict(xml_root) == {
+        "Query": {"Result": {"Answer": ["1", "2"]}, "Empty": {}}
+    }
+    assert besapi.besapi.elem2dict(xml_root, True, ["Query"]) == {
+        "Query": [
+            {
+                "@Resource": "example",
+                "Result": {
+                    "Answer": [
+                        {"@type": "integer", "#text": "1"},
+                        {"@type": "integer", "#text": "2"},
+                    ]
+                },
+                "Empty": {},
+            }
+        ]
+    }
+
+    # deeper than the recursion limit:
+    deep_xml = "<a>" * (sys.getrecursionlimit() + 10) + "x"
+    deep_xml += "</a>" * (sys.getrecursionlimit() + 10)
+    deep_root = lxml.etree.fromstring(deep_xml, lxml.etree.XMLParser(huge_tree=True))
+    assert besapi.besapi.elem2dict(deep_root) is not None
+
+
+class ListingRequestResult:
+    content = (
+        b'<BESAPI xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        b'<Computer Resource="1"><ID>1</ID><Name>one</Name></Computer>'
+        b'<Computer Resource="2"><ID>2</ID><Name>two</Name></Computer>'
+        b"<Total>2</Total>"
+        b"</BESAPI>"
+    )
+    encoding = None
+    headers: dict = {}
+
+
+def test_rest_result_write_json():
+    """Test writing json one element at a time."""
+    import io
+
+    rest_result = besapi.besapi.RESTResult(ListingRequestResult(), "off")
+
+    json_file = io.StringIO()
+    rest_result.write_json(json_file, indent=2)
+    assert json_file.getvalue() == rest_result.besjson
+
+    json_file = io.StringIO()
+    rest_result.write_json(json_file)
+    assert "\n" not in json_file.getvalue()
+    assert json.loads(json_file.getvalue()) == rest_result.besdict
+
+    json_file = io.StringIO()
+    rest_result.write_json(json_file, attributes=True, force_list=["Total"])
+    assert json.loads(json_file.getvalue()) == rest_result.to_dict(True, ["Total"])
+
+    json_file = io.StringIO()
+    rest_result.write_json(json_file, lines=True)
+    json_lines = json_file.getvalue().splitlines()
+    assert len(json_lines) == 3
+    assert json.loads(json_lines[0]) == {"Computer": {"ID": "1", "Name": "one"}}
+    assert json.loads(json_lines[2]) == {"Total": "2"}
+
+    json_file = io.StringIO()
+    besapi.besapi.RESTResult(RequestResult(), "off").write_json(json_file, indent=2)
+    assert json.loads(json_file.getvalue()) == {"text": "this is just a test"}
+
+
+def test_relevance_cache():
+    """Test the session relevance result cache."""
+    cache = besapi.besapi.RelevanceCache(ttl=300, maxsize=2)
+
+    assert cache.get(("json", "relevance 1")) is None
+    cache.set(("json", "relevance 1"), {"result": [1]})
+    cache.set(("xml", "relevance 1"), "xml result")
+    assert cache.get(("json", "relevance 1")) == {"result": [1]}
+
+    # least recently used is evicted:
+    cache.set(("json", "relevance 2"), {"result": [2]})
+    assert cache.get(("xml", "relevance 1")) is None
+    assert len(cache) == 2
+
+    assert cache.invalidate("relevance 1") == 1
+    assert cache.get(("json", "relevance 1")) is None
+    assert cache.invalidate() == 1
+
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 3,
+        "evictions": 1,
+        "size": 0,
+        "maxsize": 2,
+        "ttl": 300,
+    }
+
+    # expired entries are not used:
+    cache = besapi.besapi.RelevanceCache(ttl=-1)
+    cache.set(("json", "relevance 1"), {"result": [1]})
+    assert cache.get(("json", "relevance 1")) is None
+    assert len(cache) == 0
+
+
+class FakeResponse:
+    """The parts of a requests.Response that RESTResult uses."""
+
+    def __init__(self, content, status_code=200):
+        if not isinstance(content, bytes):
+            content = json.dumps(content).encode("utf-8")
+        self.content = content
+        self.encoding = None
+        self.status_code = status_code
+        self.url = "https://localhost:52311/api/query"
+        self.headers: dict = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise besapi.besapi.requests.HTTPError(f"{self.status_code} Error")
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        pass
+
+
+class FakeSession:
+    """Stand in for requests.Session that records requests."""
+
+    def __init__(self, responses):
+        # a function of (method, url, kwargs) that returns a FakeResponse:
+        self.responses = responses
+        self.requests: list = []
+        self.auth = None
+        self.cookies = besapi.besapi.requests.cookies.RequestsCookieJar()
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return self.responses(method, url, kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        pass
+
+
+def get_fake_bes_conn(responses, username="user", **kwargs):
+    """Get a lazy_login BESConnection that uses a FakeSession."""
+    bes_conn = besapi.besapi.BESConnection(
+        username, "password", "localhost", lazy_login=True, **kwargs
+    )
+    bes_conn.session = FakeSession(responses)
+    return bes_conn
+
+
+def get_query_relevance(kwargs):
+    """Get the relevance of a json session relevance query request."""
+    return besapi.besapi.urllib.parse.unquote(kwargs["data"]["relevance"])
+
+
+def test_bes_conn_relevance_cache():
+    """Test that session relevance results are cached per operator."""
+    status_codes = {"error": 500}
+
+    def responses(_method, _url, kwargs):
+        if isinstance(kwargs["data"], str):
+            # xml query:
+            relevance = besapi.besapi.urllib.parse.unquote(kwargs["data"])
+            return FakeResponse(
+                b"<BESAPI><Query><Result><Answer>1</Answer></Result></Query></BESAPI>",
+                status_codes.get(relevance.split("=", 1)[1], 200),
+            )
+        if get_query_relevance(kwargs) == "error":
+            return FakeResponse({"error": "bad relevance"})
+        return FakeResponse({"result": [1], "plural": True})
+
+    cache = besapi.besapi.RelevanceCache()
+    bes_conn = get_fake_bes_conn(responses, relevance_cache=cache, validation="off")
+    session = bes_conn.session
+
+    assert bes_conn.session_relevance_json("number 1")["result"] == [1]
+    assert bes_conn.session_relevance_json("number 1")["result"] == [1]
+    assert len(session.requests) == 1
+    assert cache.stats()["hits"] == 1
+
+    # errors are not cached:
+    assert "error" in bes_conn.session_relevance_json("error")
+    assert "error" in bes_conn.session_relevance_json("error")
+    assert len(session.requests) == 3
+
+    assert bes_conn.session_relevance_array("number 1") == ["1"]
+    assert bes_conn.session_relevance_array("number 1") == ["1"]
+    assert len(session.requests) == 4
+
+    # non 200 responses are not cached:
+    bes_conn.session_relevance_xml("error")
+    bes_conn.session_relevance_xml("error")
+    assert len(session.requests) == 6
+
+    # another operator sharing the cache does not get these results:
+    other_conn = get_fake_bes_conn(responses, "other", relevance_cache=cache)
+    other_conn.session_relevance_json("number 1")
+    assert len(other_conn.session.requests) == 1
+    assert len(cache) == 3
+
+
 def test_parse_bes_modtime():
     """Test the parse_bes_modtime function."""
     assert (
@@ -131,6 +559,891 @@ def test_get_action_combined_relevance():
     )
 
 
+def test_get_batch_relevance():
+    """Test combining relevance expressions into one query."""
+    assert (
+        '(0, (it as string) of ( number of bes computers )) ; (1, (it as string) of ( "test" ))'
+        == besapi.besapi.get_batch_relevance(["number of bes computers", '"test"'])
+    )
+
+
+def test_session_relevance_batch(monkeypatch):
+    """Test splitting up batch results, including singular answers."""
+    bes_conn = get_fake_bes_conn(None)
+    json_results = {
+        besapi.besapi.get_batch_relevance(["number of bes computers"]): {
+            "result": [0, "42"],
+            "plural": False,
+        },
+        besapi.besapi.get_batch_relevance(["names of bes sites", "1"]): {
+            "result": [[0, "master"], [1, "1"], [0, "custom"]],
+            "plural": True,
+        },
+    }
+    monkeypatch.setattr(
+        bes_conn,
+        "session_relevance_json",
+        lambda relevance: json_results.get(relevance, {"error": "bad relevance"}),
+    )
+
+    assert bes_conn.session_relevance_batch(["number of bes computers"]) == [
+        {"relevance": "number of bes computers", "result": ["42"], "error": None}
+    ]
+    results = bes_conn.session_relevance_batch(["names of bes sites", "1"])
+    assert [result["result"] for result in results] == [["master", "custom"], ["1"]]
+
+    # a failed batch is run one at a time:
+    json_results["(it as string) of ( 1 )"] = {"result": "1", "plural": False}
+    assert bes_conn.session_relevance_batch(["1", "bad"]) == [
+        {"relevance": "1", "result": ["1"], "error": None},
+        {"relevance": "bad", "result": [], "error": "bad relevance"},
+    ]
+
+
+def test_get_shard_filters():
+    """Test relevance filters for sharded queries."""
+    assert besapi.besapi.get_modulo_shard_filters(2) == [
+        "(id of it) mod 2 = 0",
+        "(id of it) mod 2 = 1",
+    ]
+    assert besapi.besapi.get_range_shard_filters(0, 25, 10, "item 0 of it") == [
+        "(item 0 of it) >= 0 AND (item 0 of it) < 10",
+        "(item 0 of it) >= 10 AND (item 0 of it) < 20",
+        "(item 0 of it) >= 20 AND (item 0 of it) < 25",
+    ]
+
+
+def test_session_relevance_sharded(monkeypatch):
+    """Test running shards in parallel and merging their rows."""
+    import threading
+    import time
+
+    bes_conn = get_fake_bes_conn(None)
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def session_relevance_json(relevance):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+        if "mod 4 = 3" in relevance:
+            # a shard with a single answer:
+            return {"result": [3, "three"], "plural": False}
+        if "bad" in relevance:
+            return {"error": "bad relevance"}
+        shard = int(relevance.split("mod 4 = ")[1][0])
+        return {"result": [[shard, "a"], [shard + 4, "b"]], "plural": True}
+
+    monkeypatch.setattr(bes_conn, "session_relevance_json", session_relevance_json)
+
+    relevance = "(id of it, name of it) of bes computers whose({shard})"
+    rows = list(
+        bes_conn.session_relevance_sharded(
+            relevance, besapi.besapi.get_modulo_shard_filters(4), max_workers=2
+        )
+    )
+    assert sorted(rows) == [
+        [0, "a"],
+        [1, "a"],
+        [2, "a"],
+        [3, "three"],
+        [4, "b"],
+        [5, "b"],
+        [6, "b"],
+    ]
+    assert running["max"] <= 2
+
+    with pytest.raises(ValueError):
+        list(bes_conn.session_relevance_sharded(relevance, ["bad"]))
+
+    with pytest.raises(ValueError):
+        list(bes_conn.session_relevance_sharded("bes computers", ["bad"]))
+
+
+def test_iter_json_array():
+    """Test incrementally parsing the result array of a json response."""
+    document = json.dumps(
+        {
+            "result": [[1, 'Ünïcödé, "quoted" ]'], [2.5, None], [300, True]],
+            "plural": True,
+            "type": "( integer, string )",
+            "evaltime_ms": 12,
+        }
+    )
+
+    # split the document every few characters, including inside values:
+    for size in (1, 3, 7, len(document)):
+        chunks = (document[i : i + size] for i in range(0, len(document), size))
+        metadata = {}
+        rows = list(besapi.besapi.iter_json_array(chunks, metadata=metadata))
+        assert rows == [[1, 'Ünïcödé, "quoted" ]'], [2.5, None], [300, True]]
+        assert metadata == {
+            "plural": True,
+            "type": "( integer, string )",
+            "evaltime_ms": 12,
+        }
+
+    metadata = {}
+    assert not list(
+        besapi.besapi.iter_json_array(['{"error": "bad relevance"}'], metadata=metadata)
+    )
+    assert metadata == {"error": "bad relevance"}
+    assert not list(besapi.besapi.iter_json_array(['{"result": [ ]}']))
+
+    # singular results are yielded as the only item:
+    metadata = {}
+    assert list(
+        besapi.besapi.iter_json_array(
+            ['{"result": 4', '2, "plural": false}'], metadata=metadata
+        )
+    ) == [42]
+    assert metadata == {"plural": False}
+    assert list(besapi.besapi.iter_json_array(['{"result": "text"}'])) == ["text"]
+    assert list(
+        besapi.besapi.iter_json_array(['{"plural": false, "result": [1, "a"]}'])
+    ) == [[1, "a"]]
+    # plural is sent after the result, so short arrays are held back:
+    document = '{"result": [1, "a"], "plural": false, "type": "( integer, string )"}'
+    assert list(besapi.besapi.iter_json_array([document])) == [[1, "a"]]
+    document = '{"result": [1, "a"], "plural": true}'
+    assert list(besapi.besapi.iter_json_array([document])) == [1, "a"]
+    assert list(besapi.besapi.iter_json_array(['{"result": [1, "a"]}'])) == [1, "a"]
+
+    # large arrays are streamed without waiting for plural:
+    def chunks():
+        yield '{"result": [1, 2, 3'
+        raise AssertionError("read past the first items")
+
+    items = besapi.besapi.iter_json_array(chunks(), max_tuple_items=1)
+    assert [next(items), next(items)] == [1, 2]
+
+    with pytest.raises(ValueError):
+        list(besapi.besapi.iter_json_array(['{"result": [1, 2']))
+
+
+def test_relevance_columns():
+    """Test typed columnar storage of relevance tuple results."""
+    columns = besapi.relevance_columns
+    result = columns.ColumnarResult.from_rows(
+        [
+            [1, "Windows", "True", "Tue, 14 Oct 2025 16:05:30 +0000"],
+            [2, "Linux", False, "Wed, 15 Oct 2025 16:05:30 +0000"],
+            [3, "Windows", True, "Thu, 16 Oct 2025 16:05:30 +0000"],
+        ],
+        [("id", "int"), ("os", "str"), ("locked", "bool"), ("seen", "time")],
+    )
+
+    assert len(result) == 3
+    assert result.names == ["id", "os", "locked", "seen"]
+    assert result["id"].data.typecode == "q"
+    assert result["os"].data[0] is result["os"].data[2]
+    assert result.row(1)[2] is False
+    assert result.row(0)[3].isoformat() == "2025-10-14T16:05:30+00:00"
+    assert result.group_count("os") == {"Windows": 2, "Linux": 1}
+    assert result.group_by("os", "id") == {"Windows": 4, "Linux": 2}
+
+    windows = result.filter("os", lambda value: value == "Windows")
+    assert [row[0] for row in windows.rows()] == [1, 3]
+    assert windows.take([1]).to_dicts()[0]["id"] == 3
+
+    single = columns.ColumnarResult.from_rows(["a", "b"], [("name", "str")])
+    assert list(single["name"]) == ["a", "b"]
+
+    with pytest.raises(ValueError):
+        result.append([4, "Mac"])
+    # a bad value does not leave the columns misaligned:
+    with pytest.raises(ValueError):
+        result.append([4, "Mac", "maybe", "Fri, 17 Oct 2025 16:05:30 +0000"])
+    with pytest.raises(OverflowError):
+        result.append([2**64, "Mac", True, "Fri, 17 Oct 2025 16:05:30 +0000"])
+    assert {len(column) for column in result.columns.values()} == {3}
+    with pytest.raises(ValueError):
+        columns.ColumnarResult([("id", "decimal")])
+
+
+def test_session_relevance_columns():
+    """Test streaming plural and singular results into columns."""
+    json_results = {
+        "plural": {"result": [[1, "a"], [2, "b"]], "plural": True},
+        "tuple": {"result": [3, "c"], "plural": False, "type": "( integer, string )"},
+        "single": {"result": 42, "plural": False, "type": "integer"},
+        "empty": {"result": [], "plural": True},
+    }
+    bes_conn = get_fake_bes_conn(
+        lambda _method, _url, kwargs: FakeResponse(
+            json_results[get_query_relevance(kwargs)]
+        )
+    )
+    columns = [("id", "int"), ("name", "str")]
+
+    assert list(bes_conn.session_relevance_columns("plural", columns).rows()) == [
+        (1, "a"),
+        (2, "b"),
+    ]
+    assert list(bes_conn.session_relevance_columns("tuple", columns).rows()) == [
+        (3, "c")
+    ]
+    assert list(bes_conn.session_relevance_json_iter("single", chunk_size=4)) == [42]
+    result = bes_conn.session_relevance_columns("single", [("id", "int")])
+    assert list(result["id"]) == [42]
+    assert len(bes_conn.session_relevance_columns("empty", columns)) == 0
+
+
+def test_relevance_profiler():
+    """Test the summary statistics and table of a relevance profile."""
+    import besapi.relevance_profiler
+
+    profiler = besapi.relevance_profiler
+    assert profiler.percentile([], 50) is None
+    assert profiler.percentile([4, 1, 3, 2], 50) == 2.5
+    assert profiler.percentile([1, 2, 3, 4, 5], 90) == 4.6
+
+    summary = profiler.summarize([2, None, 4])
+    assert summary["min"] == 2 and summary["mean"] == 3 and summary["max"] == 4
+    assert profiler.summarize([None]) is None
+
+    samples = [
+        {"evaltime_ms": 10.0, "round_trip_ms": 25.5, "payload_bytes": 100}
+        for _ in range(3)
+    ]
+    profile = {"relevance": "names of bes computers", "errors": []}
+    for metric in profiler.METRICS:
+        profile[metric] = profiler.summarize(sample.get(metric) for sample in samples)
+
+    table = profiler.report_table({"profiles": [profile]}).splitlines()
+    assert len(table) == 3
+    assert table[0].startswith("Relevance")
+    assert table[2].split() == [
+        "names",
+        "of",
+        "bes",
+        "computers",
+        "-",
+        "100",
+        "10",
+        "10",
+        "25.50",
+        "25.50",
+        "0",
+    ]
+
+    json_results = {
+        "singular tuple": {"result": [1, "a"], "plural": False, "evaltime_ms": 3},
+        "plural": {"result": [[1, "a"], [2, "b"]], "plural": True, "evaltime_ms": 5},
+        "bad": {"error": "bad relevance"},
+    }
+    bes_conn = get_fake_bes_conn(
+        lambda _method, _url, kwargs: FakeResponse(
+            json_results[get_query_relevance(kwargs)]
+        )
+    )
+    sample = profiler.run_relevance(bes_conn, "singular tuple")
+    assert sample["result_count"] == 1
+    assert sample["evaltime_ms"] == 3
+    assert profiler.run_relevance(bes_conn, "plural")["result_count"] == 2
+    assert profiler.run_relevance(bes_conn, "bad")["error"] == "bad relevance"
+
+
+def test_relevance_lint():
+    """Test finding slow patterns in relevance."""
+    import besapi.relevance_lint
+
+    lint = besapi.relevance_lint
+    assert lint.analyze_relevance("not exists relay service") == []
+    assert lint.suggest_evaluation_period(0) is None
+
+    findings = lint.analyze_relevance(
+        'exists wmi "root\\cimv2" AND exists lines of files "c:\\a.log" AND '
+        "exists sha256 of files of descendants of folders of folders "
+        '"C:\\Temp"'
+    )
+    assert [finding["pattern"] for finding in findings] == [
+        "wmi",
+        "descendants",
+        "log lines",
+        "hashing",
+        "folders of folders",
+    ]
+    assert (
+        lint.score_relevance('lines containing "error" of file "/var/log/messages.log"')
+        == 4
+    )
+    # a line and a log file in unrelated clauses are not log lines:
+    assert (
+        lint.analyze_relevance(
+            'exists line 1 of file "a.txt" AND exists file "c:\\a.log"; '
+            'number of lines of file "b.ini"; '
+            'line 1 of file "a.txt" AND size of file "b.log" > 0'
+        )
+        == []
+    )
+    score = lint.score_relevance("exists wmi AND exists descendants of folder")
+    assert score == 10
+    assert lint.suggest_evaluation_period(score) == "12:00:00"
+
+    reports = lint.analyze_bes_file("tests/good/RelaySelectTask.bes")
+    assert len(reports) == 1
+    assert reports[0]["type"] == "Task"
+    assert reports[0]["score"] == 0
+    assert reports[0]["evaluation_period"] is None
+
+    files = {report["file"] for report in lint.analyze_folder("tests/good")}
+    assert os.path.join("tests/good", "RelaySelectTask.bes") in files
+
+
+def test_single_flight():
+    """Test that identical concurrent calls share one call."""
+    import threading
+    import time
+
+    single_flight = besapi.besapi.SingleFlight()
+    release = threading.Event()
+
+    def slow_call():
+        release.wait(5)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight.do("key", slow_call))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    while single_flight.stats()["shared"] < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 3
+    assert results[0] is results[1] is results[2]
+    assert single_flight.stats() == {"calls": 1, "shared": 2, "in_flight": 0}
+
+    # calls that are not concurrent are not shared:
+    assert single_flight.do("key", slow_call) is not results[0]
+
+    with pytest.raises(ZeroDivisionError):
+        single_flight.do("error", lambda: 1 / 0)
+    assert single_flight.stats()["in_flight"] == 0
+
+
+def test_bes_conn_single_flight():
+    """Test that identical concurrent requests on a connection are shared."""
+    import threading
+    import time
+
+    release = threading.Event()
+
+    def responses(_method, url, kwargs):
+        release.wait(5)
+        if url.endswith("/computers"):
+            return FakeResponse(b"<BESAPI></BESAPI>")
+        if isinstance(kwargs["data"], str):
+            return FakeResponse(
+                b"<BESAPI><Query><Result><Answer>1</Answer></Result></Query></BESAPI>"
+            )
+        return FakeResponse({"result": [1], "plural": True})
+
+    bes_conn = get_fake_bes_conn(responses, single_flight=True, validation="off")
+    calls = [
+        lambda: bes_conn.get("computers"),
+        lambda: bes_conn.session_relevance_json("number 1"),
+        lambda: bes_conn.session_relevance_xml("number 1"),
+    ]
+    results: dict = {call: [] for call in calls}
+    threads = [
+        threading.Thread(target=lambda call=call: results[call].append(call()))
+        for call in calls
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    while bes_conn.single_flight.stats()["shared"] < 6:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(bes_conn.session.requests) == 3
+    for call_results in results.values():
+        assert len(call_results) == 3
+        assert call_results[0] is call_results[1] is call_results[2]
+    assert bes_conn.single_flight.stats() == {"calls": 3, "shared": 6, "in_flight": 0}
+
+
+def test_get_relevance_set_chunks():
+    """Test splitting values into relevance set literals."""
+    assert besapi.besapi.get_relevance_string('50% "off"') == '"50%25 %22off%22"'
+
+    values = ["a", "b", 1, "a", "c"]
+    assert list(besapi.besapi.get_relevance_set_chunks(values, 2)) == [
+        '"a";"b"',
+        '"1";"c"',
+    ]
+    assert list(besapi.besapi.get_relevance_set_chunks(values, 10, 8)) == [
+        '"a";"b"',
+        '"1";"c"',
+    ]
+    assert not list(besapi.besapi.get_relevance_set_chunks([]))
+
+
+def test_session_relevance_set_membership(monkeypatch):
+    """Test querying chunks of values and merging the results."""
+    bes_conn = get_fake_bes_conn(None)
+    relevances = []
+
+    def session_relevance_json(relevance):
+        relevances.append(relevance)
+        if "bad" in relevance:
+            return {"error": "bad relevance"}
+        values = relevance.split("set of (", 1)[1].rstrip(")").split(";")
+        if len(values) == 1:
+            # a single answer is not in a list:
+            return {"result": values[0].strip('"'), "plural": False}
+        # the same computer can match values in different chunks:
+        return {"result": ["shared"] + [value.strip('"') for value in values]}
+
+    monkeypatch.setattr(bes_conn, "session_relevance_json", session_relevance_json)
+
+    results = bes_conn.session_relevance_set_membership(
+        "names of bes computers whose(name of it is contained by set of ({values}))",
+        ["a", "b", "c", "a", "d", "e"],
+        chunk_size=2,
+        max_workers=2,
+    )
+    assert sorted(results) == ["a", "b", "c", "d", "e", "shared"]
+    assert len(relevances) == 3
+
+    relevances.clear()
+    results = bes_conn.session_relevance_set_membership(
+        "set of ({values})", ["a", "b", "c"], max_length=8
+    )
+    assert sorted(results) == ["a", "b", "c", "shared"]
+    assert len(relevances) == 2
+
+    with pytest.raises(ValueError):
+        bes_conn.session_relevance_set_membership("bad ({values})", ["a"])
+    with pytest.raises(ValueError):
+        bes_conn.session_relevance_set_membership("bes computers", ["a"])
+
+
+def test_relevance_incremental(tmp_path):
+    """Test merging incremental relevance results with a saved watermark."""
+    import besapi.relevance_incremental
+
+    class FakeConnection:
+        def __init__(self, rows):
+            self.rows = rows
+            self.relevances = []
+
+        def session_relevance_json(self, relevance):
+            self.relevances.append(relevance)
+            if len(self.rows) == 1:
+                # a single row is returned as a singular tuple:
+                return {"result": self.rows[0], "plural": False}
+            return {"result": self.rows, "plural": True}
+
+    relevance = "(id of it, last report time of it) of bes computers whose(last report time of it > {since})"
+    state_file = str(tmp_path / "state.json")
+    query = besapi.relevance_incremental.IncrementalRelevance(
+        relevance, state_file, overlap=0
+    )
+    bes_conn = FakeConnection(
+        [[1, "Tue, 14 Oct 2025 16:05:30 +0000"], [2, "Wed, 15 Oct 2025 16:05:30 +0000"]]
+    )
+    assert len(query.run(bes_conn)) == 2
+    assert '("Thu, 01 Jan 1970 00:00:00 +0000" as time)' in bes_conn.relevances[0]
+
+    # a new instance picks up the saved state:
+    query = besapi.relevance_incremental.IncrementalRelevance(
+        relevance, state_file, overlap=0
+    )
+    assert len(query) == 2
+    bes_conn.rows = [[1, "Thu, 16 Oct 2025 16:05:30 +0000"]]
+    query.run(bes_conn)
+    assert '("Wed, 15 Oct 2025 16:05:30 +0000" as time)' in bes_conn.relevances[1]
+    assert query.rows == [
+        [1, "Thu, 16 Oct 2025 16:05:30 +0000"],
+        [2, "Wed, 15 Oct 2025 16:05:30 +0000"],
+    ]
+
+    with pytest.raises(ValueError):
+        besapi.relevance_incremental.IncrementalRelevance("bes computers", state_file)
+
+
+def test_get_retry():
+    """Test the retry policy used for BESConnection."""
+    retry = besapi.besapi.get_retry(5, backoff_factor=1)
+    assert retry.total == 5
+    assert retry.backoff_factor == 1
+    assert retry.respect_retry_after_header
+    assert 503 in retry.status_forcelist
+    assert "GET" in retry.allowed_methods
+    assert "POST" not in retry.allowed_methods
+
+
+def test_bes_conn_pool_and_retries(tmp_path):
+    """Test that pool size and retries reach the mounted adapters."""
+    bes_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True, pool_maxsize=5, retries=2
+    )
+    adapter = bes_conn.session.get_adapter(bes_conn.url("computers"))
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 2
+    assert "POST" not in adapter.max_retries.allowed_methods
+
+    # only session relevance queries retry POST:
+    adapter = bes_conn.session.get_adapter(bes_conn.url("query"))
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 2
+    assert "POST" in adapter.max_retries.allowed_methods
+
+    adapter = bes_conn.session.get_adapter(bes_conn.url("upload/hash/file"))
+    assert isinstance(adapter, besapi.besapi.HTTPAdapterBlocksize)
+    assert adapter._pool_maxsize == 5
+    assert "POST" not in adapter.max_retries.allowed_methods
+
+    # no retries by default:
+    bes_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True
+    )
+    adapter = bes_conn.session.get_adapter(bes_conn.url("query"))
+    assert adapter._pool_maxsize == 10
+    assert adapter.max_retries.total == 0
+
+    conf_file = tmp_path / "besapi.conf"
+    conf_file.write_text(
+        "[besapi]\n"
+        "BES_ROOT_SERVER = localhost\n"
+        "BES_USER_NAME = user\n"
+        "BES_PASSWORD = password\n"
+        "BES_POOL_MAXSIZE = 4\n"
+        "BES_RETRIES = 3\n"
+        "BES_RETRY_BACKOFF_FACTOR = 1.5\n"
+    )
+    bes_conn = besapi.besapi.get_bes_conn_using_config_file(
+        str(conf_file), lazy_login=True
+    )
+    adapter = bes_conn.session.get_adapter(bes_conn.url("query"))
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 3
+    assert adapter.max_retries.backoff_factor == 1.5
+
+
+def test_async_response():
+    """Test that RESTResult works with responses from the async connection."""
+    import besapi.besapi_async
+
+    class AiohttpResponse:
+        charset = None
+        status = 200
+        reason = "OK"
+        url = "https://localhost:52311/api/computers"
+        headers = {"content-type": "application/xml"}
+
+    response = besapi.besapi_async.AsyncResponse(
+        AiohttpResponse(), XMLRequestResult.text.encode("utf-8")
+    )
+    rest_result = besapi.besapi.RESTResult(response)
+    assert rest_result.status_code == 200
+    assert rest_result.text == XMLRequestResult.text
+    assert rest_result.besobj.NotAnElement == "Example"
+    response.raise_for_status()
+
+    AiohttpResponse.status = 404
+    response = besapi.besapi_async.AsyncResponse(AiohttpResponse(), b"")
+    with pytest.raises(besapi.besapi.requests.HTTPError):
+        response.raise_for_status()
+
+
+class FakeClientResponse:
+    """Stand in for an aiohttp.ClientResponse used with `async with`."""
+
+    charset = None
+    reason = "OK"
+
+    def __init__(self, session, url, status, content):
+        self.session = session
+        self.url = url
+        self.status = status
+        self.content = content
+        self.headers: dict = {}
+
+    async def read(self):
+        import asyncio
+
+        session = self.session
+        session.running += 1
+        session.max_running = max(session.max_running, session.running)
+        await asyncio.sleep(0.01)
+        session.running -= 1
+        return self.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc_info):
+        pass
+
+
+class FakeClientSession:
+    """Stand in for aiohttp.ClientSession that records requests."""
+
+    def __init__(self, responses, **kwargs):
+        # a function of (method, url, kwargs) that returns (status, content):
+        self.responses = responses
+        self.kwargs = kwargs
+        self.requests: list = []
+        self.closed = False
+        self.running = 0
+        self.max_running = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return FakeClientResponse(self, url, *self.responses(method, url, kwargs))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_async_bes_conn(monkeypatch, tmp_path):
+    """Test AsyncBESConnection with a stand in aiohttp session."""
+    import asyncio
+    import ssl
+
+    aiohttp = pytest.importorskip("aiohttp")
+    import besapi.besapi_async
+
+    site_listing = (
+        b"<BESAPI>"
+        b'<Fixlet Resource="https://localhost:52311/api/fixlet/custom/Example/1" LastModified="now">'
+        b"<Name>One</Name><ID>1</ID></Fixlet>"
+        b'<Task Resource="https://localhost:52311/api/task/custom/Example/2" LastModified="now">'
+        b"<Name>Two</Name><ID>2</ID></Task>"
+        b"</BESAPI>"
+    )
+
+    def responses(_method, url, kwargs):
+        path = url.split("/api/", 1)[1]
+        if path == "query":
+            return 200, json.dumps({"result": [1, 2], "plural": True}).encode()
+        if path == "site/custom/Example/content":
+            return 200, site_listing
+        if path.startswith(("fixlet/", "task/")):
+            item_type = path.split("/", 1)[0].capitalize()
+            title = "One" if path.endswith("/1") else "Two"
+            return (
+                200,
+                (
+                    f"<BES><{item_type}><Title>{title}</Title></{item_type}></BES>"
+                ).encode(),
+            )
+        if path == "missing":
+            return 404, b"not found"
+        return 200, b"<BESAPI></BESAPI>"
+
+    sessions = []
+
+    def client_session(**kwargs):
+        sessions.append(FakeClientSession(responses, **kwargs))
+        return sessions[-1]
+
+    monkeypatch.setattr(aiohttp, "ClientSession", client_session)
+    monkeypatch.setattr(aiohttp, "TCPConnector", lambda **kwargs: kwargs)
+
+    async def run():
+        bes_conn = besapi.besapi_async.AsyncBESConnection(
+            "user", "password", "localhost", validation="off"
+        )
+        async with bes_conn:
+            assert bes_conn.last_connected is not None
+            session = sessions[0]
+            assert session.kwargs["connector"] == {"limit": 10, "ssl": False}
+
+            assert await bes_conn.session_relevance_json_array("ids") == [1, 2]
+
+            results = await bes_conn.get_many(["computers"] * 6, max_concurrent=2)
+            assert [result.status_code for result in results] == [200] * 6
+            assert session.max_running <= 2
+
+            item_path = await bes_conn.export_item_by_resource(
+                "https://localhost:52311/api/fixlet/custom/Example/1",
+                str(tmp_path) + "/",
+            )
+            assert item_path.endswith("One.bes")
+
+            item_paths = await bes_conn.export_site_contents(
+                "custom/Example", str(tmp_path) + "/export/", max_concurrent=2
+            )
+            assert sorted(os.path.basename(path) for path in item_paths) == [
+                "1-One.bes",
+                "2-Two.bes",
+            ]
+            with open(item_paths[1], "rb") as bes_file:
+                assert b"<Title>Two</Title>" in bes_file.read()
+
+            with pytest.raises(besapi.besapi.requests.HTTPError):
+                (await bes_conn.get("missing")).request.raise_for_status()
+
+            # put and post take validate_xml like BESConnection:
+            result = await bes_conn.put("computers", b"<BESAPI/>", validate_xml=False)
+            assert result.status_code == 200
+            assert "validate_xml" not in session.requests[-1][2]
+            with pytest.raises(ValueError):
+                await bes_conn.put("computers", b"<Bad/>", validate_xml=True)
+            with pytest.raises(ValueError):
+                await bes_conn.post("computers", b"<Bad/>", validate_xml=True)
+
+        assert session.closed
+
+    asyncio.run(run())
+
+    # verify works like requests, including the path to a CA bundle:
+    bes_conn = besapi.besapi_async.AsyncBESConnection(
+        "user", "password", "localhost", verify=True
+    )
+    assert bes_conn.get_ssl() is True
+    bes_conn.verify = besapi.besapi.requests.certs.where()
+    assert isinstance(bes_conn.get_ssl(), ssl.SSLContext)
+
+
+def test_thread_safe_site_path(monkeypatch):
+    """Test that site path context is kept per thread when thread_safe."""
+    import threading
+
+    monkeypatch.setattr(besapi.besapi.BESConnection, "login", lambda self: True)
+    bes_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", thread_safe=True
+    )
+    assert bes_conn.rootserver == "https://localhost:52311"
+
+    with bes_conn.using_site_path("custom/Example") as site_path:
+        assert site_path == "custom/Example"
+        assert bes_conn.get_current_site_path() == "custom/Example"
+
+        other_thread_site_paths = []
+        other_thread = threading.Thread(
+            target=lambda: other_thread_site_paths.append(bes_conn.site_path)
+        )
+        other_thread.start()
+        other_thread.join()
+        assert other_thread_site_paths == ["master"]
+
+    assert bes_conn.site_path == "master"
+
+    with pytest.raises(ValueError):
+        with bes_conn.using_site_path("bad/Example"):
+            pass
+
+
+def test_thread_safe_shared_connection():
+    """Test many threads sharing one thread_safe connection."""
+    import threading
+    import time
+
+    def responses(_method, url, _kwargs):
+        if url.endswith(("/login", "/webreports")):
+            # slow enough for the other threads to arrive while it runs:
+            time.sleep(0.05)
+        return FakeResponse(b"<BESAPI></BESAPI>")
+
+    bes_conn = get_fake_bes_conn(responses, thread_safe=True, validation="off")
+    barrier = threading.Barrier(8)
+    site_paths = {}
+    errors = []
+
+    def worker(index):
+        try:
+            with bes_conn.using_site_path(f"custom/Site{index}"):
+                barrier.wait(5)
+                assert bes_conn.ensure_authenticated() is True
+                assert bes_conn.am_i_main_operator() is True
+                bes_conn.get(f"site/{bes_conn.get_current_site_path()}")
+                site_paths[index] = bes_conn.site_path
+        except Exception as err:  # pylint: disable=broad-except
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    urls = [url for _method, url, _kwargs in bes_conn.session.requests]
+    # only one login and one main operator check for all of the threads:
+    assert sum(url.endswith("/login") for url in urls) == 1
+    assert sum(url.endswith("/webreports") for url in urls) == 1
+    # each thread used its own site path:
+    assert site_paths == {index: f"custom/Site{index}" for index in range(8)}
+    assert sorted(url.rsplit("/", 1)[1] for url in urls if "/site/" in url) == [
+        f"Site{index}" for index in range(8)
+    ]
+    assert bes_conn.site_path == "master"
+
+
+def test_lazy_login():
+    """Test that a lazy_login connection makes no request until used."""
+    bes_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True
+    )
+    assert bes_conn.last_connected is None
+    assert bool(bes_conn) is True
+
+    bes_conn.login_failed = True
+    assert bool(bes_conn) is False
+
+    bes_conn.authenticated = True
+    assert bool(bes_conn) is True
+    bes_conn.logout()
+    assert bes_conn.last_connected is None
+    assert bes_conn.authenticated is False
+
+
+def test_lazy_login_unauthorized():
+    """Test that a 401 on a lazy connection is not treated as connected."""
+    status_codes = {"login": 401, "computers": 401}
+    bes_conn = get_fake_bes_conn(
+        lambda _method, url, _kwargs: FakeResponse(
+            b"<BESAPI></BESAPI>", status_codes[url.rsplit("/", 1)[1]]
+        ),
+        validation="off",
+    )
+
+    bes_conn.get("computers")
+    assert bes_conn.last_connected is not None
+    assert bool(bes_conn) is False
+
+    # a real login request is made, and it fails:
+    with pytest.raises(besapi.besapi.requests.HTTPError):
+        bes_conn.ensure_authenticated()
+    assert bes_conn.session.requests[-1][1].endswith("/api/login")
+    assert bool(bes_conn) is False
+
+    status_codes["login"] = 200
+    assert bes_conn.ensure_authenticated() is True
+    assert bool(bes_conn) is True
+
+    # no login request once a request has been accepted:
+    request_count = len(bes_conn.session.requests)
+    assert bes_conn.ensure_authenticated() is True
+    assert bool(bes_conn) is True
+    assert len(bes_conn.session.requests) == request_count
+
+    # a connection that is not lazy logs in again after logout, like bescli does:
+    bes_conn.lazy_login = False
+    bes_conn.logout()
+    assert bool(bes_conn) is True
+    assert len(bes_conn.session.requests) == request_count + 1
+    assert bes_conn.session.requests[-1][1].endswith("/api/login")
+
+
 def test_get_target_xml():
     """Test the get_target_xml function with various inputs."""
     assert "<CustomRelevance>False</CustomRelevance>" == besapi.besapi.get_target_xml()
@@ -415,6 +1728,197 @@ def test_plugin_utilities_logging():
         assert os.path.isfile("./tests.log")
 
 
+def test_plugin_utilities_session_cache(tmp_path, monkeypatch):
+    """Test saving and loading the encrypted session cache."""
+    if os.name == "nt":
+        pytest.skip("Skipping session cache test, uses DPAPI on Windows.")
+
+    plugin_utilities = besapi.plugin_utilities
+    path = plugin_utilities.get_session_cache_path("https://a:52311", "user", "cache")
+    assert path.startswith("cache")
+    assert path != plugin_utilities.get_session_cache_path(
+        "https://a:52311", "other", "cache"
+    )
+
+    bes_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True
+    )
+    bes_conn.last_connected = besapi.besapi.datetime.datetime.now()
+    bes_conn.is_main_operator = True
+    bes_conn.session.cookies.set("session", "cookie value", domain="localhost")
+
+    # without encryption available the cache is disabled:
+    monkeypatch.setattr(plugin_utilities, "Fernet", None)
+    assert plugin_utilities.save_session_cache(bes_conn, "password", tmp_path) is None
+    monkeypatch.undo()
+
+    pytest.importorskip("cryptography")
+    file_path = plugin_utilities.save_session_cache(bes_conn, "password", tmp_path)
+    with open(file_path, encoding="utf-8") as cache_file:
+        assert "cookie value" not in cache_file.read()
+
+    new_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True
+    )
+    assert not plugin_utilities.load_session_cache(new_conn, "wrong", tmp_path)
+    assert not os.path.isfile(file_path)
+
+    plugin_utilities.save_session_cache(bes_conn, "password", tmp_path)
+    assert plugin_utilities.load_session_cache(new_conn, "password", tmp_path)
+    assert new_conn.session.cookies.get("session") == "cookie value"
+    assert new_conn.is_main_operator is True
+    assert new_conn.last_connected is not None
+    assert new_conn.authenticated
+
+
+class FakeCipher:
+    """Stand in for a Fernet, so the session cache can be tested without it."""
+
+    def __init__(self, password):
+        self.prefix = password.encode("utf-8") + b":"
+
+    def encrypt(self, data):
+        return base64.b64encode(self.prefix + data)
+
+    def decrypt(self, token):
+        data = base64.b64decode(token)
+        if not data.startswith(self.prefix):
+            raise besapi.plugin_utilities.InvalidToken()
+        return data[len(self.prefix) :]
+
+
+def test_plugin_utilities_session_cache_fake_cipher(tmp_path, monkeypatch):
+    """Test the cached connection and the 401 refresh hook with a fake cipher."""
+    if os.name == "nt":
+        pytest.skip("Skipping session cache test, uses DPAPI on Windows.")
+
+    plugin_utilities = besapi.plugin_utilities
+    ciphers = []
+
+    def get_fake_cipher(password, _salt):
+        ciphers.append(password)
+        return FakeCipher(password)
+
+    monkeypatch.setattr(plugin_utilities, "Fernet", FakeCipher)
+    monkeypatch.setattr(plugin_utilities, "get_session_cache_fernet", get_fake_cipher)
+    at_exit: list = []
+    monkeypatch.setattr(plugin_utilities.atexit, "register", at_exit.append)
+    monkeypatch.setattr(
+        plugin_utilities.atexit,
+        "unregister",
+        lambda func: at_exit.remove(func) if func in at_exit else None,
+    )
+    monkeypatch.setattr(plugin_utilities, "_session_cache_pending", {})
+    logins = []
+
+    def login(self):
+        logins.append(self)
+        self.session.cookies.set("session", f"cookie {len(logins)}", domain="localhost")
+        self.last_connected = besapi.besapi.datetime.datetime.now()
+        self.authenticated = True
+        return True
+
+    monkeypatch.setattr(besapi.besapi.BESConnection, "login", login)
+
+    # a fresh login is saved right away, and not again at exit if unchanged:
+    bes_conn = plugin_utilities.get_besapi_connection_cached(
+        "user", "password", "localhost", tmp_path
+    )
+    assert len(logins) == 1
+    assert len(ciphers) == 1
+    assert at_exit == [plugin_utilities.save_pending_session_caches]
+    plugin_utilities.save_pending_session_caches()
+    assert len(ciphers) == 1
+
+    # the next run loads the cache instead of logging in:
+    bes_conn = plugin_utilities.get_besapi_connection_cached(
+        "user", "password", "localhost", tmp_path
+    )
+    assert len(logins) == 1
+    assert len(ciphers) == 2
+    assert bes_conn.session.cookies.get("session") == "cookie 1"
+    assert bes_conn.authenticated
+    assert bes_conn
+    assert len(logins) == 1
+
+    # only the last connection for a cache path is saved, by one handler:
+    old_conn = bes_conn
+    bes_conn = plugin_utilities.get_besapi_connection_cached(
+        "user", "password", "localhost", tmp_path
+    )
+    assert len(ciphers) == 3
+    assert at_exit == [plugin_utilities.save_pending_session_caches]
+    assert len(plugin_utilities._session_cache_pending) == 1
+
+    # changes during the run are saved at exit:
+    old_conn.is_main_operator = False
+    bes_conn.is_main_operator = True
+    plugin_utilities.save_pending_session_caches()
+    assert len(ciphers) == 4
+    assert not plugin_utilities._session_cache_pending
+    new_conn = besapi.besapi.BESConnection(
+        "user", "password", "localhost", lazy_login=True
+    )
+    assert plugin_utilities.load_session_cache(new_conn, "password", tmp_path)
+    assert new_conn.is_main_operator is True
+
+    # a cache that is not the expected JSON object is invalid and removed:
+    cache_path = plugin_utilities.get_session_cache_path(
+        bes_conn.rootserver, bes_conn.username, tmp_path
+    )
+    for plaintext in ["[]", '{"rootserver": "https://localhost:52311/"}']:
+        encrypted = plugin_utilities.session_cache_encrypt(plaintext, "password")
+        for cache_data in [[encrypted], encrypted]:
+            with open(cache_path, "w", encoding="utf-8") as cache_file:
+                json.dump(cache_data, cache_file)
+            new_conn = besapi.besapi.BESConnection(
+                "user", "password", "localhost", lazy_login=True
+            )
+            assert not plugin_utilities.load_session_cache(
+                new_conn, "password", tmp_path
+            )
+            assert not os.path.isfile(cache_path)
+            assert not new_conn.authenticated
+    plugin_utilities.save_session_cache(bes_conn, "password", tmp_path)
+
+    # a rejected cached session is dropped and the request sent again:
+    class FakeRequest:
+        def __init__(self, headers):
+            self.headers = headers
+
+        def copy(self):
+            return FakeRequest(dict(self.headers))
+
+    class FakeHookResponse:
+        def __init__(self, status_code, headers):
+            self.status_code = status_code
+            self.request = FakeRequest(headers)
+
+    sent = []
+    monkeypatch.setattr(
+        bes_conn.session,
+        "send",
+        lambda request, **kwargs: sent.append(request) or FakeHookResponse(200, {}),
+    )
+    hook = plugin_utilities.get_session_cache_refresh_hook(bes_conn, tmp_path)
+    cache_path = plugin_utilities.get_session_cache_path(
+        bes_conn.rootserver, bes_conn.username, tmp_path
+    )
+
+    response = FakeHookResponse(200, {"Cookie": "session=cookie 1"})
+    assert hook(response) is response
+    response = FakeHookResponse(401, {})
+    assert hook(response) is response
+    assert os.path.isfile(cache_path)
+    assert not sent
+
+    response = FakeHookResponse(401, {"Cookie": "session=cookie 1", "Accept": "*/*"})
+    assert hook(response).status_code == 200
+    assert sent[0].headers == {"Accept": "*/*"}
+    assert not bes_conn.session.cookies
+    assert not os.path.isfile(cache_path)
+
+
 def test_plugin_utilities_win_dpapi():
     """Test the Windows DPAPI encryption function, if on Windows."""
     if not os.name == "nt":